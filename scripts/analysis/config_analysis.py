@@ -184,4 +184,64 @@ linke_usernames = ["die.linke", "linkeessen", "dielinkelsa", "linke.sh", "dielin
   "gregorgysi48", "caren.lay.mdb", "susanneferschl"]
 
 start_date = "20250101"
-end_date = "20250223"
\ No newline at end of file
+end_date = "20250223"
+
+# sentiment analysis
+sentiment_model_name = "oliverguhr/german-sentiment-bert"
+sentiment_batch_size = 100
+sentiment_max_batch_tokens = 4096 # token budget per batch (longest text x number of texts), None for fixed batches of sentiment_batch_size
+sentiment_cache_path = "results/sentiment_analysis/sentiment_cache.sqlite" # None to disable the cache
+sentiment_cache_max_entries = 1000000
+sentiment_skip_label = "skipped" # label for comments without words (empty or only emojis), not scored by the model and left out of the text sentiment shares
+sentiment_workers = 1 # number of worker processes with their own model, 1 to process all users in the main process
+sentiment_threads_per_worker = None # torch threads per worker, None to split the CPU cores evenly
+sentiment_backend = "torch" # torch (germansentiment), onnx or onnx_int8 (ONNX Runtime, export with sentiment_onnx.py)
+sentiment_onnx_dir = "models/german-sentiment-bert-onnx"
+sentiment_global_queue = False # score the comments of all users in one queue instead of per user (main process only)
+sentiment_global_chunk_size = 20000 # number of waiting comments after which the queued users are scored together
+sentiment_max_length = None # token cap per comment (including [CLS] and [SEP]), None for the model maximum of 512
+sentiment_truncation = "head" # head: keep the beginning of long comments, head_tail: keep beginning and end
+sentiment_model_registry = "models/sentiment_registry.json" # local model store pinned by path and hash (sentiment_model_store.py), None to load through the Hugging Face cache
+sentiment_model_store = "models/sentiment"
+sentiment_warmup = True # score one small batch after loading the model
+
+# emoji analysis
+emoji_workers = None # processes for counting emojis per comment file, None for all CPUs
+emoji_count_mode = "exact" # exact (Counter) or sketch (SpaceSaving/Count-Min with bounded memory, mergeable across runs)
+sketch_capacity = 2000 # SpaceSaving counters, the error of a reported count is at most total / capacity
+sketch_width = 16384 # Count-Min columns, error at most e / width * total with probability 1 - e^-depth
+sketch_depth = 4
+sketch_top_k = 500 # rows in the CSV files in sketch mode, None for all counters
+emoji_cooccurrence_top_n = 100 # emoji pairs per party in the co-occurrence tables
+emoji_cooccurrence_min_count = 5 # minimum number of comments with both emojis
+
+# topic analysis
+topic_model_name = "ft:gpt-4.1-nano-2025-04-14:caro-haensch:reginav2:BoWObdmF"
+topic_mode = "sync" # sync (concurrent requests) or batch (Batch API, half the price, answers within 24 hours)
+topic_api_base_url = None # None for the OpenAI API, e.g. "http://127.0.0.1:8000/v1" for the local stand-in (topic_standin_server.py)
+topic_max_tokens = 10
+topic_tokenizer_encoding = "o200k_base" # tiktoken encoding of the GPT-4.1 models
+topic_video_token_budget = 512 # tokens for description and transcript of a video, None to send the full texts
+topic_price_input = 0.20 # USD per million prompt tokens (fine-tuned GPT-4.1-nano), the Batch API costs half
+topic_price_output = 0.80 # USD per million answer tokens
+topic_pack_size = 1 # videos per request, more than 1 for packed prompts with a JSON answer
+topic_pack_answer_tokens = 16 # answer tokens per video of a packed prompt
+topic_temperature = 0.0
+topic_concurrency = 16 # requests in flight at the same time
+topic_requests_per_minute = 500 # rate limits of the API account, None for no limit
+topic_tokens_per_minute = 200000
+topic_max_retries = 5 # retries after rate limit, connection and server errors
+topic_timeout = 60 # seconds per request
+topic_cache_path = "results/topic_analysis/topic_cache.sqlite" # responses by hash of model, temperature, answer tokens and prompt, None to disable
+topic_batch_dir = "results/topic_analysis/batches" # batch files and ids of submitted batches
+topic_batch_poll_interval = 60 # seconds between status checks of a batch
+topic_pack_benchmark_endpoint = "standin" # standin (checks only the parsing of packed answers) or api (topic_api_base_url or the OpenAI API with real videos)
+topic_pack_benchmark_sample = 200 # real videos per pack size in the api mode of topic_benchmark.py
+topic_local_classifier = False # assign videos close to one topic centroid of the labelled videos locally, only the others are sent to the LLM
+topic_embedding_model = "paraphrase-multilingual-MiniLM-L12-v2" # sentence-transformers model, runs on the CPU
+topic_embedding_batch_size = 64
+topic_local_margin = 0.08 # minimum difference of cosine similarity between the nearest and second nearest topic centroid
+topic_local_audit_share = 0.1 # share of the local topics also sent to the LLM to measure the agreement, must be more than 0
+topic_centroids_path = "results/topic_analysis/topic_centroids.npz" # topic centroids saved with the embedding model name, None to embed the labelled videos every run
+topic_labeled_dir = "data/data_preprocessed/videos/labeled" # labelled videos (preprocess_labeled_data.py)
+topic_examples_path = "data/data_raw/topic_examples_original.jsonl" # fine-tuning examples, used if there are no labelled videos
@@ -0,0 +1,33 @@
+import os
+import numpy as np
+import pandas as pd
+
+# sentiment_label: 1 = positive, 0 = neutral, -1 = negative
+LABELS = np.array([-1, 0, 1], dtype=np.int8)
+
+def compile_emoji_lexicon(input_path, output_path):
+    """Compiles the emoji sentiment data into a sorted array of emojis with int8 labels."""
+    emoji_data = pd.read_csv(input_path, sep=";")
+    # the first entry counts if an emoji appears more than once
+    emoji_data = emoji_data.drop_duplicates("Emoji")
+    counts = emoji_data[["Negative", "Neutral", "Positive"]].to_numpy(dtype=np.float64)
+    # shares of negative, neutral, positive as score
+    scores = counts / counts.sum(axis=1, keepdims=True)
+
+    # sentiment label based on the maximum share, neutral if two shares are equal
+    is_max = scores == scores.max(axis=1, keepdims=True)
+    labels = LABELS[scores.argmax(axis=1)]
+    labels[is_max.sum(axis=1) != 1] = 0
+
+    emojis = emoji_data["Emoji"].to_numpy(dtype=str)
+    order = np.argsort(emojis)
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    np.savez(output_path, emojis=emojis[order], labels=labels[order])
+    print(f"Emoji lexicon with {len(emojis)} emojis saved at: {output_path}")
+
+def load_emoji_lexicon(path, source_path=None):
+    """Loads the compiled lexicon as dict emoji -> sentiment label, compiles it first if the source data is newer."""
+    if source_path and (not os.path.exists(path) or os.path.getmtime(path) < os.path.getmtime(source_path)):
+        compile_emoji_lexicon(source_path, path)
+    with np.load(path) as data:
+        return dict(zip(data["emojis"].tolist(), data["labels"].tolist()))
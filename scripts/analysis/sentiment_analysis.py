@@ -1,7 +1,44 @@
 import pandas as pd
+import numpy as np
 import config_analysis as config
 import os
+import sys
+import glob
+import shutil
+import itertools
+import time
+import multiprocessing
+import torch
 from germansentiment import SentimentModel
+from sentiment_cache import make_cache_key, open_cache, lookup_sentiments, store_sentiments, evict_cache, PROBABILITY_COLUMNS
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'common')))
+from dataset_catalog import find_file, make_period
+from sentiment_model_store import get_registered_model, load_stored_model, warm_up
+
+# labels of the german sentiment bert model, the class probabilities are saved in this order
+SENTIMENT_LABELS = ["positive", "negative", "neutral"]
+
+def load_sentiment_model(backend, model_name, num_threads=None):
+    """Loads the sentiment model for the backend: torch (germansentiment), onnx or onnx_int8 (ONNX Runtime)."""
+    if backend == "torch":
+        # the local model store is loaded offline and checked against the pinned file hashes
+        entry = get_registered_model(config.sentiment_model_registry, model_name)
+        model = load_stored_model(entry) if entry else SentimentModel(model_name)
+    elif backend in ("onnx", "onnx_int8"):
+        # ONNX Runtime is only needed for the onnx backends
+        from sentiment_onnx import OnnxSentimentModel
+        model = OnnxSentimentModel(config.sentiment_onnx_dir, quantized=(backend == "onnx_int8"), num_threads=num_threads)
+    else:
+        raise ValueError(f"Unknown sentiment backend: {backend}")
+    if config.sentiment_warmup:
+        warm_up(model)
+    return model
+
+def get_model_id(backend, model_name):
+    """Returns the id of the model for the cache, the onnx backends get their own entries."""
+    if backend == "torch":
+        return model_name
+    return f"{model_name}:{backend}"
 
 def load_comments(input_path):
     """Load comments from a CSV file."""
@@ -12,56 +49,500 @@ def load_comments(input_path):
         print(f"Comment data not found: {input_path}. Skipped.")
         return None
 
-def compute_sentiments(texts, model, batch_size=100):
-    """Compute sentiments for a list of texts using a sentiment model."""
-    sentiments = []
+def get_token_lengths(texts, model):
+    """Get the number of tokens of each (cleaned) text as encoded by the sentiment model, truncated texts are given as token ids."""
+    strings = [text for text in texts if isinstance(text, str)]
+    encoded = iter(model.tokenizer(strings, add_special_tokens=True, truncation=True)["input_ids"]) if strings else iter([])
+    return [len(next(encoded)) if isinstance(text, str) else len(text) + 2 for text in texts]
+
+def make_batches(num_texts, batch_size, lengths=None, max_tokens=None):
+    """Split text indices into batches, either fixed in file order or by token budget."""
+    if lengths is None or max_tokens is None:
+        indices = list(range(num_texts))
+        return [indices[i:i+batch_size] for i in range(0, num_texts, batch_size)]
+    # sort texts by length so texts of similar length are padded together
+    order = sorted(range(num_texts), key=lambda i: lengths[i])
+    batches = []
+    batch = []
+    for i in order:
+        # the current text is the longest of the batch, all texts are padded to its length
+        if batch and (len(batch) + 1) * lengths[i] > max_tokens:
+            batches.append(batch)
+            batch = []
+        batch.append(i)
+    if batch:
+        batches.append(batch)
+    return batches
+
+def class_probabilities(prediction):
+    """Orders the class probabilities of one text as returned by predict_sentiment like SENTIMENT_LABELS."""
+    scores = {label: score for label, score in prediction}
+    return [scores[label] for label in SENTIMENT_LABELS]
+
+def truncate_texts(texts, model, max_length=None, strategy="head"):
+    """Shortens cleaned texts with more than max_length tokens (including [CLS] and [SEP]), None for the model maximum.
+    head keeps the beginning, head_tail the beginning and the end of the text.
+    Returns the texts with the kept token ids (without [CLS] and [SEP]) in place of the truncated texts
+    and a flag for each text if it was truncated."""
+    if not texts:
+        return texts, []
+    limit = (max_length or model.tokenizer.model_max_length) - 2
+    token_ids = model.tokenizer(texts, add_special_tokens=False)["input_ids"]
+    truncated_texts = []
+    flags = []
+    for text, ids in zip(texts, token_ids):
+        if len(ids) <= limit:
+            truncated_texts.append(text)
+            flags.append(False)
+            continue
+        if strategy == "head_tail":
+            head = limit // 2
+            ids = ids[:head] + ids[len(ids) - (limit - head):]
+        elif strategy == "head":
+            ids = ids[:limit]
+        else:
+            raise ValueError(f"Unknown truncation strategy: {strategy}")
+        # the token ids are scored directly, decoding and tokenizing again could change them
+        truncated_texts.append(ids)
+        flags.append(True)
+    return truncated_texts, flags
+
+def predict_token_ids(model, token_ids):
+    """Scores texts given as token ids (without [CLS] and [SEP]), returns labels and probabilities like predict_sentiment."""
+    input_ids = [model.tokenizer.build_inputs_with_special_tokens(ids) for ids in token_ids]
+    width = max(len(ids) for ids in input_ids)
+    encoded = {
+        "input_ids": np.full((len(input_ids), width), model.tokenizer.pad_token_id, dtype=np.int64),
+        "attention_mask": np.zeros((len(input_ids), width), dtype=np.int64),
+        "token_type_ids": np.zeros((len(input_ids), width), dtype=np.int64)
+    }
+    for row, ids in enumerate(input_ids):
+        encoded["input_ids"][row, :len(ids)] = ids
+        encoded["attention_mask"][row, :len(ids)] = 1
+    if hasattr(model, "predict_encoded"):
+        # ONNX Runtime backends
+        return model.predict_encoded(encoded, output_probabilities=True)
+    with torch.no_grad():
+        logits = model.model(**{name: torch.from_numpy(array).to(model.device) for name, array in encoded.items()})[0]
+    id2label = model.model.config.id2label
+    labels = [id2label[label_id] for label_id in logits.argmax(dim=1).tolist()]
+    predictions = torch.softmax(logits, dim=-1).tolist()
+    return labels, [[[id2label[index], item] for index, item in enumerate(prediction)] for prediction in predictions]
+
+def score_texts(texts, model, batch_size=100, max_tokens=None, stats=None, on_batch=None):
+    """Score cleaned texts (or token ids of truncated texts) with the sentiment model in batches, sentiments and class
+    probabilities are returned in the original order. on_batch is called with the indices, sentiments and probabilities
+    of each finished batch."""
+    if not texts:
+        return [], []
+    lengths = get_token_lengths(texts, model) if max_tokens is not None else None
+    batches = make_batches(len(texts), batch_size, lengths, max_tokens)
+    sentiments = [None] * len(texts)
+    probabilities = [None] * len(texts)
     # process texts in batches
-    num_batches = (len(texts) + batch_size - 1) // batch_size
-    for i in range(0, len(texts), batch_size):
-        batch_num = i // batch_size + 1
+    num_batches = len(batches)
+    for batch_num, indices in enumerate(batches, start=1):
         print(f"Processing batch {batch_num} of {num_batches} batches...")
-        batch = texts[i:i+batch_size]
-        batch_sentiments = model.predict_sentiment(batch)
-        sentiments.extend(batch_sentiments)
+        batch = [texts[i] for i in indices]
+        if stats is not None:
+            # how much of the batch capacity is used (tokens with token budget, rows without)
+            if max_tokens is not None:
+                padded = len(indices) * max(lengths[i] for i in indices)
+                stats["tokens"] = stats.get("tokens", 0) + sum(lengths[i] for i in indices)
+                stats["padded_tokens"] = stats.get("padded_tokens", 0) + padded
+                stats["batch_fill"] = stats.get("batch_fill", 0) + min(padded, max_tokens)
+                stats["batch_capacity"] = stats.get("batch_capacity", 0) + max_tokens
+            else:
+                stats["batch_fill"] = stats.get("batch_fill", 0) + len(indices)
+                stats["batch_capacity"] = stats.get("batch_capacity", 0) + batch_size
+        start = time.perf_counter()
+        if all(isinstance(text, str) for text in batch):
+            batch_sentiments, batch_predictions = model.predict_sentiment(batch, output_probabilities=True)
+        else:
+            token_ids = [model.tokenizer(text, add_special_tokens=False)["input_ids"] if isinstance(text, str) else text for text in batch]
+            batch_sentiments, batch_predictions = predict_token_ids(model, token_ids)
+        if stats is not None:
+            stats.setdefault("batch_times", []).append(time.perf_counter() - start)
+        batch_probabilities = [class_probabilities(prediction) for prediction in batch_predictions]
+        # write sentiments back to the original position of the texts
+        for i, sentiment, probs in zip(indices, batch_sentiments, batch_probabilities):
+            sentiments[i] = sentiment
+            probabilities[i] = probs
+        if on_batch is not None:
+            on_batch(indices, batch_sentiments, batch_probabilities)
+    if stats is not None:
+        stats["model_texts"] = stats.get("model_texts", 0) + len(texts)
+        stats["batches"] = stats.get("batches", 0) + num_batches
+    return sentiments, probabilities
+
+def has_words(cleaned_text):
+    """Checks if a cleaned text contains anything the model can score (not empty or missing)."""
+    return cleaned_text not in ("", "nan")
+
+def label_agreement(reference, candidate, skip_label="skipped"):
+    """Returns the share of equal labels of two runs over the texts both runs scored, NaN if there are none."""
+    pairs = [(a, b) for a, b in zip(reference, candidate) if a != skip_label and b != skip_label]
+    return sum(a == b for a, b in pairs) / len(pairs) if pairs else np.nan
+
+def compute_sentiments(texts, model, batch_size=100, max_tokens=None, stats=None, cache=None, model_id=None,
+                       skip_label="skipped", on_batch=None, output_probabilities=False, max_length=None, truncation="head"):
+    """Compute sentiments for a list of texts using a sentiment model.
+    Texts without words get skip_label without inference, each distinct text is scored only once
+    and looked up in the cache first if a cache is given. on_batch is called with the indices,
+    sentiments, probabilities and truncation flags of the texts as soon as they are known. With output_probabilities
+    the class probabilities (ordered like SENTIMENT_LABELS, NaN for skipped texts) and the truncation flags are returned as well.
+    Texts longer than max_length tokens (None for the model maximum) are truncated with the truncation strategy (head or head_tail)."""
+    # normalise texts the same way the model does, texts with equal cleaned text get the same sentiment
+    # missing texts (NaN, None) are skipped like empty ones
+    cleaned = [model.clean_text(text) if isinstance(text, str) else "" for text in texts]
+    sentiments = [None] * len(texts)
+    probabilities = [None] * len(texts)
+    truncated = [False] * len(texts)
+    # positions of each distinct text in the list of texts
+    positions = {}
+    skipped = []
+    for i, text in enumerate(cleaned):
+        if has_words(text):
+            positions.setdefault(text, []).append(i)
+        else:
+            sentiments[i] = skip_label
+            probabilities[i] = [np.nan] * len(SENTIMENT_LABELS)
+            skipped.append(i)
+    unique_texts = list(positions)
+    model_inputs, unique_truncated = truncate_texts(unique_texts, model, max_length, truncation)
+    model_inputs = dict(zip(unique_texts, model_inputs))
+    for text, flag in zip(unique_texts, unique_truncated):
+        for i in positions[text]:
+            truncated[i] = flag
+
+    keys = {}
+    if cache is not None:
+        # truncated texts can get another sentiment, so the truncation is part of their key
+        cap = max_length or model.tokenizer.model_max_length
+        keys = {
+            text: make_cache_key(text, f"{model_id}|{truncation}:{cap}" if flag else model_id)
+            for text, flag in zip(unique_texts, unique_truncated)
+        }
+        cached = lookup_sentiments(cache, list(keys.values()))
+        for text, key in keys.items():
+            if key in cached:
+                for i in positions[text]:
+                    sentiments[i], probabilities[i] = cached[key]
+
+    missing = [text for text in unique_texts if sentiments[positions[text][0]] is None]
+    if on_batch is not None:
+        # skipped texts and cache hits are done before the inference starts
+        done = [i for i, sentiment in enumerate(sentiments) if sentiment is not None]
+        if done:
+            on_batch(done, [sentiments[i] for i in done], [probabilities[i] for i in done], [truncated[i] for i in done])
+
+    def save_batch(indices, batch_sentiments, batch_probabilities):
+        """Writes the results of a scored batch to all positions of its texts."""
+        batch_positions = []
+        for i, sentiment, probs in zip(indices, batch_sentiments, batch_probabilities):
+            for position in positions[missing[i]]:
+                sentiments[position] = sentiment
+                probabilities[position] = probs
+                batch_positions.append(position)
+        if on_batch is not None:
+            on_batch(batch_positions, [sentiments[i] for i in batch_positions], [probabilities[i] for i in batch_positions],
+                     [truncated[i] for i in batch_positions])
+
+    scored, scored_probabilities = score_texts([model_inputs[text] for text in missing], model, batch_size, max_tokens, stats, save_batch)
+    if cache is not None and missing:
+        store_sentiments(cache, {keys[text]: (sentiment, probs) for text, sentiment, probs in zip(missing, scored, scored_probabilities)})
+
+    if stats is not None:
+        stats["texts"] = stats.get("texts", 0) + len(texts)
+        stats["skipped_texts"] = stats.get("skipped_texts", 0) + len(skipped)
+        stats["unique_texts"] = stats.get("unique_texts", 0) + len(unique_texts)
+        stats["cache_hits"] = stats.get("cache_hits", 0) + len(unique_texts) - len(missing)
+        stats["truncated_texts"] = stats.get("truncated_texts", 0) + sum(unique_truncated)
+    if output_probabilities:
+        return sentiments, probabilities, truncated
     return sentiments
 
-def process_user(user, start_date, end_date, model, batch_size):
-    """Process sentiment analysis for a user."""
-    input_path = f"data/data_preprocessed/comments/{user}_comments_{start_date}_{end_date}_preprocessed.csv"
+def print_inference_stats(stats):
+    """Prints how many texts were skipped, deduplicated, found in the cache and scored by the model."""
+    texts = stats.get("texts", 0)
+    if texts == 0:
+        return
+    skipped = stats.get("skipped_texts", 0)
+    unique = stats.get("unique_texts", 0)
+    hits = stats.get("cache_hits", 0)
+    model_texts = stats.get("model_texts", 0)
+    print(f"Texts without words (not scored): {skipped} of {texts}")
+    print(f"Duplicate texts (not scored): {texts - skipped - unique}")
+    if unique > 0:
+        print(f"Cache hits: {hits} of {unique} distinct texts (hit rate {hits / unique:.2%})")
+    print(f"Texts scored by the model: {model_texts} of {texts} ({texts - model_texts} inference calls avoided)")
+    if stats.get("truncated_texts", 0) > 0:
+        print(f"Truncated texts: {stats['truncated_texts']}")
+    if stats.get("batch_capacity", 0) > 0:
+        print(f"Batches: {stats.get('batches', 0)}, batch fill ratio {stats['batch_fill'] / stats['batch_capacity']:.2%}")
+    if stats.get("padded_tokens", 0) > 0:
+        print(f"Tokens: {stats['tokens']} of {stats['padded_tokens']} padded tokens are text ({stats['tokens'] / stats['padded_tokens']:.2%})")
+
+def make_sentiment_frame(ids, sentiments, probabilities, truncated):
+    """Creates a dataframe indexed by comment id with the sentiment, the class probabilities and the truncation flag."""
+    df = pd.DataFrame(probabilities, columns=PROBABILITY_COLUMNS, dtype="float64").round(5).astype("float32")
+    df.insert(0, "sentiment", sentiments)
+    df["text_truncated"] = pd.Series(truncated, dtype="bool")
+    df.index = pd.Index(ids, name="id")
+    return df
+
+def load_checkpoint(checkpoint_dir):
+    """Loads the sentiments of all finished batches of a user as a dataframe indexed by comment id."""
+    files = sorted(glob.glob(os.path.join(checkpoint_dir, "batch_*.csv")))
+    if not files:
+        return make_sentiment_frame([], [], [], [])
+    df = pd.concat([pd.read_csv(file) for file in files], ignore_index=True)
+    df = df.drop_duplicates(subset="id", keep="last")
+    df = df.set_index("id").reindex(columns=["sentiment"] + PROBABILITY_COLUMNS + ["text_truncated"])
+    # shards of older runs have no truncation flag
+    df["text_truncated"] = df["text_truncated"].fillna(False).astype("bool")
+    return df.astype({col: "float32" for col in PROBABILITY_COLUMNS})
+
+def save_checkpoint_batch(checkpoint_dir, batch_num, ids, sentiments, probabilities, truncated):
+    """Saves the sentiments of a finished batch as a separate shard file."""
+    path = os.path.join(checkpoint_dir, f"batch_{batch_num:06d}.csv")
+    # write to a temporary file first so that a crash never leaves a half written shard
+    tmp_path = path + ".tmp"
+    make_sentiment_frame(ids, sentiments, probabilities, truncated).to_csv(tmp_path)
+    os.replace(tmp_path, path)
+
+def prepare_user(user, start_date, end_date):
+    """Loads the comments of a user that still need a sentiment, returns None if the user is done or has no data."""
+    input_path = find_file(user, make_period(start_date, end_date), "comments")
     output_dir = f"results/sentiment_analysis/{start_date}_{end_date}"
     os.makedirs(output_dir, exist_ok=True)
-    output_path = f"{output_dir}/{user}_comments_with_sentiment.csv"
     output_complete = f"{output_dir}/{user}_comments_with_sentiment_complete.csv"
+    checkpoint_dir = f"{output_dir}/checkpoints/{user}"
 
     if os.path.exists(output_complete):
         print(f"Sentiment analysis for {user} already done. Skipping.")
-        return
+        return None
 
+    if input_path is None:
+        print(f"Comment data not found for {user}. Skipped.")
+        return None
     df_comments = load_comments(input_path)
     if df_comments is None:
-        return
+        return None
+
+    # resume after the batches finished in an earlier run
+    os.makedirs(checkpoint_dir, exist_ok=True)
+    done = load_checkpoint(checkpoint_dir)
+    todo = df_comments[~df_comments['id'].isin(done.index)]
+    if len(done) > 0:
+        print(f"Resuming {user}: {len(df_comments) - len(todo)} comments already scored, {len(todo)} left.")
+    return {
+        "user": user,
+        "df_comments": df_comments,
+        "done": done,
+        "texts": todo['text'].fillna("").astype(str).tolist(),
+        "ids": todo['id'].tolist(),
+        "checkpoint_dir": checkpoint_dir,
+        "shard_numbers": itertools.count(len(glob.glob(os.path.join(checkpoint_dir, "batch_*.csv"))) + 1),
+        "output_path": f"{output_dir}/{user}_comments_with_sentiment.csv",
+        "output_complete": output_complete
+    }
+
+def save_user_batch(job, indices, sentiments, probabilities, truncated):
+    """Saves a finished batch of a user as checkpoint shard, indices refer to the texts of the user."""
+    ids = [job["ids"][i] for i in indices]
+    save_checkpoint_batch(job["checkpoint_dir"], next(job["shard_numbers"]), ids, sentiments, probabilities, truncated)
+
+def finish_user(job, sentiments, probabilities, truncated):
+    """Assembles the complete file of a user from the checkpoint and the new sentiments."""
+    df_comments = job["df_comments"]
+    all_sentiments = pd.concat([job["done"], make_sentiment_frame(job["ids"], sentiments, probabilities, truncated)])
+    all_sentiments = all_sentiments[~all_sentiments.index.duplicated(keep="last")]
+    # text_truncated marks the comments that were too long for the token cap (or the maximum length of the model)
+    for col in all_sentiments.columns:
+        df_comments[col] = df_comments['id'].map(all_sentiments[col])
+    df_comments.to_csv(job["output_path"], index=False)
+    # replacing the file is atomic, the _complete file is either missing or complete
+    os.replace(job["output_path"], job["output_complete"])
+    shutil.rmtree(job["checkpoint_dir"])
+    print(f"Sentiment analysis completed for {job['user']} and saved with prefix _complete.")
 
+def score_user(job, model, batch_size, max_tokens=None, cache=None, stats=None, model_id=None):
+    """Scores the remaining comments of one prepared user and writes the result."""
+    sentiments, probabilities, truncated = compute_sentiments(
+        job["texts"], model, batch_size, max_tokens, stats, cache, model_id, config.sentiment_skip_label,
+        lambda *batch: save_user_batch(job, *batch),
+        output_probabilities=True, max_length=config.sentiment_max_length, truncation=config.sentiment_truncation
+    )
+    finish_user(job, sentiments, probabilities, truncated)
+
+def process_user(user, start_date, end_date, model, batch_size, max_tokens=None, cache=None, stats=None, model_id=None):
+    """Process sentiment analysis for a user."""
     try:
+        job = prepare_user(user, start_date, end_date)
+        if job is None:
+            return
         print(f"Processing sentiment for {user}...")
-        texts = df_comments['text'].astype(str).tolist()
-        sentiments = compute_sentiments(texts, model, batch_size)
-        df_comments['sentiment'] = sentiments
-        df_comments.to_csv(output_path, index=False)
-        os.rename(output_path, output_complete)
-        print(f"Sentiment analysis completed for {user} and saved with prefix _complete.")
+        score_user(job, model, batch_size, max_tokens, cache, stats, model_id)
     except KeyError:
         print(f"Error when adding sentiment for {user}.")
     except Exception as e:
         print(f"Error for {user}: {e}")
 
+def score_users_together(jobs, model, batch_size, max_tokens=None, cache=None, stats=None, model_id=None):
+    """Scores the remaining comments of several users in one queue and writes the result of each user."""
+    texts = []
+    # user and position in the texts of the user for each text of the queue
+    owners = []
+    for job_num, job in enumerate(jobs):
+        texts.extend(job["texts"])
+        owners.extend((job_num, i) for i in range(len(job["texts"])))
+    print(f"Processing sentiment for {len(jobs)} users with {len(texts)} comments together...")
+
+    def save_batch(indices, batch_sentiments, batch_probabilities, batch_truncated):
+        """Routes the results of a batch back to the checkpoints of the users."""
+        by_job = {}
+        for index, sentiment, probs, flag in zip(indices, batch_sentiments, batch_probabilities, batch_truncated):
+            job_num, i = owners[index]
+            job_indices, job_sentiments, job_probabilities, job_truncated = by_job.setdefault(job_num, ([], [], [], []))
+            job_indices.append(i)
+            job_sentiments.append(sentiment)
+            job_probabilities.append(probs)
+            job_truncated.append(flag)
+        for job_num, job_batch in by_job.items():
+            save_user_batch(jobs[job_num], *job_batch)
+
+    try:
+        sentiments, probabilities, truncated = compute_sentiments(
+            texts, model, batch_size, max_tokens, stats, cache, model_id, config.sentiment_skip_label, save_batch,
+            output_probabilities=True, max_length=config.sentiment_max_length, truncation=config.sentiment_truncation
+        )
+    except Exception as e:
+        # the finished batches are in the checkpoints, score the users one by one so one bad user does not stop the others
+        print(f"Error for the queue of {len(jobs)} users: {e}. Scoring them one by one...")
+        for job in jobs:
+            try:
+                score_user(job, model, batch_size, max_tokens, cache, stats, model_id)
+            except Exception as e:
+                print(f"Error for {job['user']}: {e}")
+        return
+    start = 0
+    for job in jobs:
+        end = start + len(job["texts"])
+        try:
+            finish_user(job, sentiments[start:end], probabilities[start:end], truncated[start:end])
+        except Exception as e:
+            print(f"Error for {job['user']}: {e}")
+        start = end
+
+def process_users_global(usernames, start_date, end_date, model, batch_size, max_tokens=None, cache=None, stats=None, model_id=None, chunk_size=20000):
+    """Process sentiment analysis for all users in one queue, batches are filled across account boundaries.
+    Users are collected until chunk_size comments are waiting, then they are scored together."""
+    pending = []
+    num_pending = 0
+    for user in usernames:
+        try:
+            job = prepare_user(user, start_date, end_date)
+        except Exception as e:
+            print(f"Error for {user}: {e}")
+            continue
+        if job is None:
+            continue
+        pending.append(job)
+        num_pending += len(job["texts"])
+        if num_pending >= chunk_size:
+            score_users_together(pending, model, batch_size, max_tokens, cache, stats, model_id)
+            pending = []
+            num_pending = 0
+    if pending:
+        score_users_together(pending, model, batch_size, max_tokens, cache, stats, model_id)
+
+def merge_stats(total, stats):
+    """Adds the counters and batch times of one run to the total stats."""
+    for key, value in stats.items():
+        if isinstance(value, list):
+            total.setdefault(key, []).extend(value)
+        else:
+            total[key] = total.get(key, 0) + value
+    return total
+
+# model and cache of a worker process, loaded once when the worker starts
+worker_model = None
+worker_cache = None
+worker_model_id = None
+
+def init_worker(backend, model_name, num_threads, cache_path):
+    """Loads a separate model copy in a worker process and limits its torch threads."""
+    global worker_model, worker_cache, worker_model_id
+    torch.set_num_threads(num_threads)
+    worker_model = load_sentiment_model(backend, model_name, num_threads)
+    worker_cache = open_cache(cache_path) if cache_path else None
+    worker_model_id = get_model_id(backend, model_name)
+
+def process_user_worker(task):
+    """Processes one user in a worker process and returns the stats."""
+    user, start_date, end_date, batch_size, max_tokens = task
+    stats = {}
+    process_user(user, start_date, end_date, worker_model, batch_size, max_tokens, worker_cache, stats, worker_model_id)
+    return stats
+
+def process_users_parallel(usernames, start_date, end_date, batch_size, max_tokens, num_workers, num_threads):
+    """Processes users in several worker processes, each with its own model, and returns the merged stats."""
+    # start with the largest accounts so that the workers finish at about the same time
+    def input_size(user):
+        path = find_file(user, make_period(start_date, end_date), "comments")
+        return os.path.getsize(path) if path else 0
+    users = sorted(usernames, key=input_size, reverse=True)
+    tasks = [(user, start_date, end_date, batch_size, max_tokens) for user in users]
+
+    stats = {}
+    context = multiprocessing.get_context("spawn")
+    init_args = (config.sentiment_backend, config.sentiment_model_name, num_threads, config.sentiment_cache_path)
+    with context.Pool(num_workers, initializer=init_worker, initargs=init_args) as pool:
+        # the workers take the next user from the task queue as soon as they are done
+        for user_stats in pool.imap_unordered(process_user_worker, tasks, chunksize=1):
+            merge_stats(stats, user_stats)
+    return stats
+
 def main():
-    model = SentimentModel() # use german sentiment bert model of oliverguhr
-    batch_size = 100
+    batch_size = config.sentiment_batch_size
+    max_tokens = config.sentiment_max_batch_tokens
     start_date = config.start_date
     end_date = config.end_date
+    num_workers = config.sentiment_workers
+    # some users are listed twice, process each user only once
+    usernames = list(dict.fromkeys(config.usernames))
+
+    # cache of already scored texts, shared across accounts and runs
+    cache = open_cache(config.sentiment_cache_path) if config.sentiment_cache_path else None
+    start = time.perf_counter()
+
+    if config.sentiment_global_queue:
+        # one queue for the comments of all users, only in the main process
+        model = load_sentiment_model(config.sentiment_backend, config.sentiment_model_name)
+        model_id = get_model_id(config.sentiment_backend, config.sentiment_model_name)
+        stats = {}
+        process_users_global(usernames, start_date, end_date, model, batch_size, max_tokens, cache, stats, model_id,
+                             config.sentiment_global_chunk_size)
+    elif num_workers > 1:
+        num_threads = config.sentiment_threads_per_worker or max(1, (os.cpu_count() or 1) // num_workers)
+        print(f"Starting {num_workers} worker processes with {num_threads} torch threads each...")
+        stats = process_users_parallel(usernames, start_date, end_date, batch_size, max_tokens, num_workers, num_threads)
+    else:
+        # use german sentiment bert model of oliverguhr
+        model = load_sentiment_model(config.sentiment_backend, config.sentiment_model_name)
+        model_id = get_model_id(config.sentiment_backend, config.sentiment_model_name)
+        stats = {}
+        for user in usernames:
+            process_user(user, start_date, end_date, model, batch_size, max_tokens, cache, stats, model_id)
 
-    for user in config.usernames:
-        process_user(user, start_date, end_date, model, batch_size)
+    duration = time.perf_counter() - start
+    print_inference_stats(stats)
+    if stats.get("texts", 0) > 0:
+        print(f"Processed {stats['texts']} texts in {duration:.1f} s ({stats['texts'] / duration:.1f} texts/sec)")
+    if cache is not None:
+        evict_cache(cache, config.sentiment_cache_max_entries)
+        cache.close()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
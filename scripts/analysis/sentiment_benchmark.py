@@ -0,0 +1,131 @@
+import glob
+import itertools
+import multiprocessing
+import os
+import resource
+import time
+import numpy as np
+import pandas as pd
+import torch
+import config_analysis as config
+from sentiment_analysis import compute_sentiments, label_agreement, load_sentiment_model
+
+SYNTHETIC_WORDS = [
+    "die", "der", "das", "und", "nicht", "ist", "wir", "ihr", "sie", "endlich", "wieder", "gut", "schlecht",
+    "danke", "super", "peinlich", "lüge", "wahlkampf", "regierung", "partei", "kanzler", "steuern", "rente",
+    "migration", "klima", "wirtschaft", "zukunft", "deutschland", "politik", "bürger", "arbeit", "schule",
+    "richtig", "falsch", "toll", "traurig", "stark", "schwach", "niemals", "immer", "genau", "leider"
+]
+
+def load_sample_texts(input_pattern, sample_size, seed=42):
+    """Loads a random sample of comment texts from the preprocessed comment files."""
+    files = glob.glob(input_pattern)
+    texts = []
+    for file in files:
+        df = pd.read_csv(file, usecols=["text"])
+        texts.extend(df["text"].fillna("").astype(str).tolist())
+    if not texts:
+        return []
+    sample = pd.Series(texts).sample(min(sample_size, len(texts)), random_state=seed)
+    return sample.tolist()
+
+def make_synthetic_texts(sample_size, seed=42):
+    """Creates synthetic comments with a long-tailed length distribution similar to real comments."""
+    rng = np.random.default_rng(seed)
+    lengths = np.clip(rng.lognormal(mean=2.3, sigma=0.9, size=sample_size).astype(int), 1, 400)
+    return [" ".join(rng.choice(SYNTHETIC_WORDS, size=length)) for length in lengths]
+
+def run_scorer(texts, model, batch_size, max_tokens, max_length=None, truncation="head"):
+    """Scores the texts once and returns the sentiments, texts per second and the p50/p99 batch time."""
+    stats = {}
+    start = time.perf_counter()
+    sentiments = compute_sentiments(texts, model, batch_size, max_tokens, stats, max_length=max_length, truncation=truncation)
+    duration = time.perf_counter() - start
+    batch_times = stats.get("batch_times", [0.0])
+    result = {
+        "texts_per_sec": round(len(texts) / duration, 1),
+        "p50_batch_ms": round(np.percentile(batch_times, 50) * 1000, 1),
+        "p99_batch_ms": round(np.percentile(batch_times, 99) * 1000, 1),
+        "batches": stats.get("batches", 0),
+        "truncated": stats.get("truncated_texts", 0)
+    }
+    return sentiments, result
+
+def run_configuration(task):
+    """Loads the model and scores the texts for one configuration in a fresh process, so load time and peak RSS are not shared."""
+    texts, settings = task
+    torch.set_num_threads(settings["threads"])
+    start = time.perf_counter()
+    model = load_sentiment_model(settings["backend"], config.sentiment_model_name, settings["threads"])
+    load_time = time.perf_counter() - start
+    max_tokens = settings["max_tokens"] if settings["bucketing"] else None
+    sentiments, result = run_scorer(texts, model, settings["batch_size"], max_tokens, settings["max_length"], settings["truncation"])
+    # ru_maxrss is in kilobytes on Linux
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return sentiments, {**settings, "model_load_s": round(load_time, 2), **result, "peak_rss_mb": round(peak_rss, 1)}
+
+def main():
+    # configurations
+    start_date = config.start_date
+    end_date = config.end_date
+    input_pattern = f"data/data_preprocessed/comments/*_comments_{start_date}_{end_date}_preprocessed.csv"
+    output_path = "results/sentiment_analysis/sentiment_benchmark.csv"
+    corpus = "sample" # sample (from the preprocessed comments) or synthetic
+    sample_size = 5000
+    max_tokens = config.sentiment_max_batch_tokens or 4096
+    truncation = config.sentiment_truncation
+
+    # sweep over all combinations, the onnx backends are included once they have been exported (sentiment_onnx.py)
+    backends = ["torch"]
+    for backend, model_file in [("onnx", "model.onnx"), ("onnx_int8", "model_int8.onnx")]:
+        if os.path.exists(os.path.join(config.sentiment_onnx_dir, model_file)):
+            backends.append(backend)
+        else:
+            print(f"No ONNX model at {os.path.join(config.sentiment_onnx_dir, model_file)}, backend {backend} is skipped.")
+    thread_counts = sorted({1, torch.get_num_threads()})
+    batch_sizes = [32, config.sentiment_batch_size]
+    bucketing = [False, True]
+    max_lengths = [None, config.sentiment_max_length or 128]
+
+    texts = load_sample_texts(input_pattern, sample_size) if corpus == "sample" else []
+    if not texts:
+        if corpus == "sample":
+            print(f"No comments found for {input_pattern}, using a synthetic corpus.")
+            corpus = "synthetic"
+        texts = make_synthetic_texts(sample_size)
+
+    tasks = [
+        (texts, {"backend": backend, "threads": threads, "batch_size": batch_size, "bucketing": bucketed,
+                 "max_tokens": max_tokens if bucketed else None, "max_length": max_length, "truncation": truncation})
+        for backend, threads, batch_size, bucketed, max_length
+        in itertools.product(backends, thread_counts, batch_sizes, bucketing, max_lengths)
+    ]
+    print(f"Running {len(tasks)} configurations on {len(texts)} {corpus} comments...")
+
+    # every configuration runs in its own process
+    results = []
+    reference = None
+    with multiprocessing.get_context("spawn").Pool(1, maxtasksperchild=1) as pool:
+        for sentiments, result in pool.imap(run_configuration, tasks):
+            if reference is None:
+                reference = sentiments
+            # agreement over the scored texts, texts without words are skipped in every configuration
+            result["agreement"] = round(label_agreement(reference, sentiments), 4)
+            results.append({"corpus": corpus, "texts": len(texts), **result})
+            print(f"Done: {result['backend']}, {result['threads']} threads, batch size {result['batch_size']}, "
+                  f"bucketing {result['bucketing']}, max length {result['max_length']}: {result['texts_per_sec']} texts/sec")
+
+    df_results = pd.DataFrame(results)
+    print(df_results.drop(columns=["corpus", "texts", "truncation", "max_tokens"]).to_string(index=False))
+    # backends side by side for the same settings
+    settings = ["threads", "batch_size", "bucketing", "max_length"]
+    for metric in ["texts_per_sec", "agreement"]:
+        print(f"\n{metric} per backend:")
+        table = df_results.fillna({"max_length": "model"}).pivot_table(index=settings, columns="backend", values=metric)
+        print(table[backends].to_string())
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    df_results.to_csv(output_path, index=False)
+    print(f"Benchmark results saved at: {output_path}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+import hashlib
+import os
+import sqlite3
+import time
+
+# class probabilities in the order of the labels of the sentiment model (positive, negative, neutral)
+PROBABILITY_COLUMNS = ["prob_positive", "prob_negative", "prob_neutral"]
+
+def make_cache_key(text, model_id):
+    """Creates the cache key from the normalised text and the model id."""
+    return hashlib.sha1(f"{model_id}\x00{text}".encode("utf-8")).hexdigest()
+
+def open_cache(path):
+    """Opens the sentiment cache (SQLite file) and creates the table if needed."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    conn = sqlite3.connect(path, timeout=60)
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS sentiments ("
+        "key TEXT PRIMARY KEY, sentiment TEXT NOT NULL, last_used REAL NOT NULL, "
+        "prob_positive REAL, prob_negative REAL, prob_neutral REAL)"
+    )
+    # caches created before the probabilities were saved get the columns added
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(sentiments)")]
+    for col in PROBABILITY_COLUMNS:
+        if col not in columns:
+            conn.execute(f"ALTER TABLE sentiments ADD COLUMN {col} REAL")
+    conn.commit()
+    return conn
+
+def lookup_sentiments(conn, keys, chunk_size=500):
+    """Returns a dict with the cached sentiment and class probabilities for each key found in the cache."""
+    found = {}
+    for i in range(0, len(keys), chunk_size):
+        chunk = keys[i:i+chunk_size]
+        placeholders = ",".join("?" * len(chunk))
+        rows = conn.execute(
+            f"SELECT key, sentiment, {', '.join(PROBABILITY_COLUMNS)} FROM sentiments "
+            f"WHERE key IN ({placeholders}) AND prob_positive IS NOT NULL",
+            chunk
+        )
+        for key, sentiment, *probabilities in rows:
+            found[key] = (sentiment, probabilities)
+    # mark hits as recently used so they are evicted last
+    now = time.time()
+    conn.executemany("UPDATE sentiments SET last_used = ? WHERE key = ?", [(now, key) for key in found])
+    conn.commit()
+    return found
+
+def store_sentiments(conn, entries):
+    """Stores a dict of key -> (sentiment, class probabilities) in the cache."""
+    now = time.time()
+    conn.executemany(
+        f"INSERT OR REPLACE INTO sentiments (key, sentiment, last_used, {', '.join(PROBABILITY_COLUMNS)}) "
+        "VALUES (?, ?, ?, ?, ?, ?)",
+        [(key, sentiment, now, *probabilities) for key, (sentiment, probabilities) in entries.items()]
+    )
+    conn.commit()
+
+def evict_cache(conn, max_entries):
+    """Deletes the least recently used entries if the cache holds more than max_entries."""
+    count = conn.execute("SELECT COUNT(*) FROM sentiments").fetchone()[0]
+    excess = count - max_entries
+    if excess > 0:
+        conn.execute(
+            "DELETE FROM sentiments WHERE key IN (SELECT key FROM sentiments ORDER BY last_used LIMIT ?)",
+            (excess,)
+        )
+        conn.commit()
+        print(f"Evicted {excess} entries from sentiment cache.")
+    return max(excess, 0)
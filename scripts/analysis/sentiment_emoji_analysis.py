@@ -1,130 +1,201 @@
-import glob
+import json
+import multiprocessing
 import os
+import sys
+import time
+import numpy as np
 import pandas as pd
 from collections import Counter
-import emoji
+from scipy import sparse
 import config_analysis as config
-import numpy as np
+from emoji_lexicon import load_emoji_lexicon
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'common')))
+from dataset_catalog import find_file, list_accounts, make_period
+from emoji_tokenizer import find_emojis_column
+from frequency_sketch import FrequencySketch
 
 
-def count_emojis_in_file(filepath):
-    """Counts emojis in a CSV file."""
+def find_emojis_in_file(filepath):
+    """Returns the list of emojis of every comment in a CSV file."""
     df = pd.read_csv(filepath, usecols=["text"])
-    counter = Counter()
-    for text in df["text"].dropna():
-        emojis = [e['emoji'] for e in emoji.emoji_list(str(text))]
-        counter.update(emojis)
-    return counter
-
-def analyze_emojis(input_dir, parteien):
-    """Analyzes emojis in comments and counts them per party."""
-    emoji_counter = Counter()
-    partei_counters = {p: Counter() for p in parteien}
-
-    for fname in os.listdir(input_dir):
-        # process only CSV files in the path (those are the comment files)
-        if fname.endswith(".csv"):
-            # extract username from filename
-            user = fname.split("_comments")[0]
-            filepath = os.path.join(input_dir, fname)
-            file_counter = count_emojis_in_file(filepath)
-            emoji_counter.update(file_counter)
-            # add emoji count to party the user belongs to
-            for partei, userlist in parteien.items():
-                if user in userlist:
-                    partei_counters[partei].update(file_counter)
-    return emoji_counter, partei_counters
-
-def save_emoji_counts(counter, path):
-    """Saves emoji counts to a CSV file."""
+    return find_emojis_column(df["text"].dropna())
+
+def build_party_lookup(parteien):
+    """Returns a dict username -> parties the user belongs to, each party once even if the user is listed twice."""
+    party_lookup = {}
+    for partei, userlist in parteien.items():
+        for user in userlist:
+            parties = party_lookup.setdefault(user, [])
+            if partei not in parties:
+                parties.append(partei)
+    return party_lookup
+
+def file_signature(filepath):
+    """Returns size and modification time of a file to detect changed comment files."""
+    stat = os.stat(filepath)
+    return [stat.st_size, stat.st_mtime_ns]
+
+def save_file_emojis(emoji_lists, path):
+    """Saves the emojis of every comment of one comment file, separated by spaces (empty if the comment has none)."""
+    pd.DataFrame({"emojis": [" ".join(emojis) for emojis in emoji_lists]}).to_csv(path, index=False)
+
+def load_file_emojis(path):
+    """Loads the emojis of every comment of one comment file saved by an earlier run."""
+    df = pd.read_csv(path, keep_default_na=False, dtype={"emojis": str})
+    return [emojis.split(" ") if emojis else [] for emojis in df["emojis"]]
+
+def find_emojis_in_files(paths, emojis_dir=None, num_workers=None):
+    """Extracts the emojis of every comment per comment file in a process pool, files unchanged since the last run are loaded from emojis_dir."""
+    manifest = {}
+    manifest_path = os.path.join(emojis_dir, "manifest.json") if emojis_dir else None
+    if manifest_path and os.path.exists(manifest_path):
+        with open(manifest_path, encoding="utf-8") as f:
+            manifest = json.load(f)
+
+    fnames = [os.path.basename(path) for path in paths]
+    signatures = {os.path.basename(path): file_signature(path) for path in paths}
+    file_emojis = {}
+    for fname in fnames:
+        if emojis_dir and manifest.get(fname) == signatures[fname] and os.path.exists(os.path.join(emojis_dir, fname)):
+            file_emojis[fname] = load_file_emojis(os.path.join(emojis_dir, fname))
+    changed = [path for path in paths if os.path.basename(path) not in file_emojis]
+    print(f"Extracting emojis from {len(changed)} files ({len(file_emojis)} unchanged files reused).")
+
+    if changed:
+        with multiprocessing.Pool(num_workers) as pool:
+            for path, emoji_lists in zip(changed, pool.imap(find_emojis_in_file, changed)):
+                fname = os.path.basename(path)
+                file_emojis[fname] = emoji_lists
+                if emojis_dir:
+                    os.makedirs(emojis_dir, exist_ok=True)
+                    save_file_emojis(emoji_lists, os.path.join(emojis_dir, fname))
+
+    if emojis_dir:
+        # emoji tables of deleted comment files are removed
+        for fname in set(manifest) - set(fnames):
+            if os.path.exists(os.path.join(emojis_dir, fname)):
+                os.remove(os.path.join(emojis_dir, fname))
+        os.makedirs(emojis_dir, exist_ok=True)
+        with open(manifest_path, "w", encoding="utf-8") as f:
+            json.dump(signatures, f, indent=2)
+    return file_emojis
+
+def analyze_emojis(period, parteien, emojis_dir=None, num_workers=None, make_counter=Counter):
+    """Analyzes emojis in comments and counts them per party, make_counter creates an exact Counter or a FrequencySketch.
+
+    Also returns the emojis of every comment per user for the co-occurrence analysis.
+    """
+    emoji_counter = make_counter()
+    partei_counters = {p: make_counter() for p in parteien}
+    party_lookup = build_party_lookup(parteien)
+
+    # comment files of all accounts in the period
+    users = list_accounts(period, "raw_comments")
+    paths = [find_file(user, period, "raw_comments") for user in users]
+    file_emojis = find_emojis_in_files(paths, emojis_dir, num_workers)
+
+    # merge the counts of all files
+    user_emojis = {}
+    for user, path in zip(users, paths):
+        user_emojis[user] = file_emojis[os.path.basename(path)]
+        counter = Counter(emoji for emojis in user_emojis[user] for emoji in emojis)
+        emoji_counter.update(counter)
+        # add emoji count to party the user belongs to
+        for partei in party_lookup.get(user, []):
+            partei_counters[partei].update(counter)
+    return emoji_counter, partei_counters, user_emojis
+
+def save_emoji_counts(counter, path, top_k=None):
+    """Saves emoji counts to a CSV file, a sketch is saved with its top k and error bounds and as .npz for later merges."""
+    if isinstance(counter, FrequencySketch):
+        counter.top_k(top_k, "emoji").to_csv(path, index=False)
+        counter.save(path.replace(".csv", ".npz"))
+        return
     df = pd.DataFrame(counter.items(), columns=["emoji", "count"]).sort_values("count", ascending=False)
     df.to_csv(path, index=False)
 
-def resolve_sentiment(row):
-    """Chooses sentiment from given scores, gives neutral sentiment is two scores are equal"""
-    scores = {
-        "negative": row["score_neg"],
-        "neutral": row["score_neu"],
-        "positive": row["score_pos"]
-    }
-    max_val = max(scores.values())
-    top_labels = [label for label, score in scores.items() if score == max_val]
-
-    if len(top_labels) > 1:
-        return "neutral"
-    return top_labels[0]
-
-def preprocess_emoji_data(input_path):
-    """Preprocesses the emoji sentiment data."""
-    emoji_data = pd.read_csv(input_path, sep=";")
-    # compute shares of positive, negative, neutral as score
-    emoji_data['N'] = emoji_data['Negative'] + emoji_data['Neutral'] + emoji_data['Positive']
-    emoji_data['score_pos'] = emoji_data['Positive'] / emoji_data['N']
-    emoji_data['score_neg'] = emoji_data['Negative'] / emoji_data['N']
-    emoji_data['score_neu'] = emoji_data['Neutral'] / emoji_data['N']
-
-    # sentiment label based on maximum share of positive, negative, neutral
-    # sentiment_label: 1 = positive, 0 = neutral, -1 = negative
-    emoji_data['sentiment_label_str'] = emoji_data.apply(resolve_sentiment, axis=1)
-
-    emoji_data['sentiment_label'] = emoji_data['sentiment_label_str'].map({
-        'negative': -1,
-        'neutral': 0,
-        'positive': 1
+def build_incidence_matrix(emoji_lists):
+    """Builds a sparse CSR comment x emoji matrix (1 if the emoji occurs in the comment) and the emoji of every column."""
+    flat = [emoji for emojis in emoji_lists for emoji in emojis]
+    codes, vocabulary = pd.factorize(pd.Series(flat, dtype=object), sort=True)
+    indptr = np.zeros(len(emoji_lists) + 1, dtype=np.int64)
+    indptr[1:] = np.cumsum([len(emojis) for emojis in emoji_lists])
+    matrix = sparse.csr_matrix((np.ones(len(flat), dtype=np.int64), codes, indptr), shape=(len(emoji_lists), len(vocabulary)))
+    # an emoji that occurs more than once in a comment counts once
+    matrix.sum_duplicates()
+    matrix.data[:] = 1
+    return matrix, np.asarray(vocabulary, dtype=object)
+
+def cooccurrence_pairs(matrix, vocabulary, top_n=100, min_count=1):
+    """Returns the emoji pairs that occur together in most comments, with lift and PMI relative to all comments of the matrix."""
+    n_comments = matrix.shape[0]
+    emoji_counts = np.asarray(matrix.sum(axis=0)).ravel()
+    # emoji x emoji matrix, entry (a, b) = number of comments with both emojis
+    cooccurrence = (matrix.T @ matrix).tocoo()
+    keep = (cooccurrence.row < cooccurrence.col) & (cooccurrence.data >= min_count)
+    a, b, count = cooccurrence.row[keep], cooccurrence.col[keep], cooccurrence.data[keep]
+    lift = count * n_comments / (emoji_counts[a] * emoji_counts[b])
+    df = pd.DataFrame({
+        "emoji_a": vocabulary[a],
+        "emoji_b": vocabulary[b],
+        "count": count,
+        "count_a": emoji_counts[a],
+        "count_b": emoji_counts[b],
+        "lift": lift,
+        "pmi": np.log2(lift)
     })
+    return df.sort_values(["count", "lift"], ascending=False).head(top_n).reset_index(drop=True)
 
-    return emoji_data
+def analyze_emoji_cooccurrence(user_emojis, parteien, top_n=100, min_count=1):
+    """Computes the emoji co-occurrence of all comments and per party as sparse matrix products from the emojis of
+    every comment per user (from analyze_emojis)."""
+    start = time.perf_counter()
+    emoji_lists = []
+    row_users = []
+    for user, lists in user_emojis.items():
+        emoji_lists.extend(lists)
+        row_users.extend([user] * len(lists))
+    matrix, vocabulary = build_incidence_matrix(emoji_lists)
+    row_users = np.array(row_users, dtype=object)
 
-def compute_emoji_sentiment(input_folder_sentiment, input_dir, emoji_df, folder_output):
+    results = {"all": cooccurrence_pairs(matrix, vocabulary, top_n, min_count)}
+    for partei, userlist in parteien.items():
+        rows = np.flatnonzero(np.isin(row_users, userlist))
+        results[partei] = cooccurrence_pairs(matrix[rows], vocabulary, top_n, min_count)
+    print(f"Emoji co-occurrence of {matrix.shape[0]} comments and {len(vocabulary)} emojis computed in {time.perf_counter() - start:.1f} s.")
+    return results
+
+def score_comment_emojis(ids, df_orig, lexicon):
+    """Returns the mean emoji sentiment and the extracted emojis for each comment id, joined on the comment id."""
+    # first original comment per id, only for the ids that are scored
+    df_orig = df_orig.drop_duplicates('id')
+    df_orig = df_orig[df_orig['id'].isin(ids)]
+    emojis_by_id = pd.Series(find_emojis_column(df_orig['text']), index=df_orig['id'])
+    extracted = emojis_by_id.reindex(ids.to_numpy()).reset_index(drop=True)
+
+    # one row per emoji, labels from the lexicon (NaN if unknown), mean per comment without NaN
+    exploded = extracted.explode().dropna()
+    labels = exploded.map(lexicon).astype(float)
+    emoji_sentiments = labels.groupby(level=0).mean().reindex(range(len(ids)))
+
+    extracted_emojis = [emojis if isinstance(emojis, list) else [] for emojis in extracted]
+    return emoji_sentiments.to_numpy(), extracted_emojis
+
+def compute_emoji_sentiment(period, lexicon, folder_output):
     """Computes emoji sentiment for each comment and saves the results."""
     os.makedirs(folder_output, exist_ok=True)
-    sentiment_files = glob.glob(input_folder_sentiment)
     # load sentiment data
-    for file in sentiment_files:
+    for user in list_accounts(period, "sentiment"):
+        file = find_file(user, period, "sentiment")
         base = os.path.basename(file)
-        user = base.split("_comments")[0]
-        # get original comment data
-        orig_file = [f for f in os.listdir(input_dir) if f.startswith(user) and f.endswith(".csv")]
-        if not orig_file:
+        # get original comment data of exactly this account and period
+        orig_path = find_file(user, period, "raw_comments")
+        if orig_path is None:
             print(f"No original comment data for {user} found.")
             continue
-        orig_path = os.path.join(input_dir, orig_file[0])
         df_orig = pd.read_csv(orig_path)
         df_sent = pd.read_csv(file)
-        # get emojis of original comments
-        df_orig['emojis'] = df_orig['text'].apply(lambda x: [e['emoji'] for e in emoji.emoji_list(str(x))])
-
-        
-        emoji_sentiments = []
-        extracted_emojis = []
-        for idx, row in df_sent.iterrows():
-            comment_id = row['id']
-            orig_row = df_orig[df_orig['id'] == comment_id]
-            if orig_row.empty:
-                emoji_sentiments.append(np.nan)
-                extracted_emojis.append([])
-                continue
-            # get emojis from original comment
-            emojis = orig_row.iloc[0]['emojis']
-            extracted_emojis.append(emojis)
-            if not emojis:
-                emoji_sentiments.append(np.nan)
-                continue
-            sentiments = []
-            # get emoji sentiment for each emoji in the comment
-            for em in emojis:
-                s = emoji_df.loc[emoji_df['Emoji'] == em, 'sentiment_label']
-                if not s.empty:
-                    sentiments.append(s.values[0])
-                else:
-                    sentiments.append(np.nan)
-            # compute mean sentiment for emojis in comment
-            if sentiments and not all(pd.isna(s) for s in sentiments):
-                emoji_sentiments.append(np.nanmean(sentiments))
-            else:
-                emoji_sentiments.append(np.nan)
-        df_sent['emoji_sentiment'] = emoji_sentiments
-        df_sent['extracted_emojis'] = extracted_emojis
+        df_sent['emoji_sentiment'], df_sent['extracted_emojis'] = score_comment_emojis(df_sent['id'], df_orig, lexicon)
         # Save
         outname = base.replace('_complete.csv', '_final.csv')
         output_path = os.path.join(folder_output, outname)
@@ -135,13 +206,18 @@ def main():
     # configurations
     start_date = config.start_date
     end_date = config.end_date
-    input_dir = "data/data_raw/comments"
+    period = make_period(start_date, end_date)
     input_path_emoji = "data/data_raw/emoji_sentiment_data.csv"
-    input_folder_sentiment = f"results/sentiment_analysis/{start_date}_{end_date}/*.csv"
+    lexicon_path = "data/data_preprocessed/emoji_lexicon.npz"
     output_folder_sentiment = f"results/sentiment_analysis/{start_date}_{end_date}_with_emoji_sentiment"
     output_dir = f"results/emoji_analysis"
     os.makedirs(output_dir, exist_ok=True)
     output_path = os.path.join(output_dir, "emoji_counts.csv")
+    emojis_dir = os.path.join(output_dir, "file_emojis")
+    if config.emoji_count_mode == "sketch":
+        make_counter = lambda: FrequencySketch(config.sketch_capacity, config.sketch_width, config.sketch_depth)
+    else:
+        make_counter = Counter
 
     parteien = {
         "afd": config.afd_usernames,
@@ -151,23 +227,30 @@ def main():
         "linke": config.linke_usernames
     }
     # Analyze emojis in comments
-    emoji_counter, partei_counters = analyze_emojis(input_dir, parteien)
+    emoji_counter, partei_counters, user_emojis = analyze_emojis(period, parteien, emojis_dir, config.emoji_workers, make_counter)
 
     # Save data complete
-    save_emoji_counts(emoji_counter, output_path)
+    save_emoji_counts(emoji_counter, output_path, config.sketch_top_k)
     print(f"Emoji-list (complete) saved at: {output_path}")
 
     # Save per party
     for partei, counter in partei_counters.items():
         partei_path = os.path.join(output_dir, f"emoji_counts_{partei}.csv")
-        save_emoji_counts(counter, partei_path)
+        save_emoji_counts(counter, partei_path, config.sketch_top_k)
         print(f"Emoji-list ({partei}) saved at: {partei_path}")
 
-    # Process extracted emoji sentiment data
-    emoji_df = preprocess_emoji_data(input_path_emoji)
+    # Emoji pairs per party
+    cooccurrence = analyze_emoji_cooccurrence(user_emojis, parteien, config.emoji_cooccurrence_top_n, config.emoji_cooccurrence_min_count)
+    for partei, df_pairs in cooccurrence.items():
+        pairs_path = os.path.join(output_dir, f"emoji_cooccurrence_{partei}.csv")
+        df_pairs.to_csv(pairs_path, index=False)
+        print(f"Emoji pairs ({partei}) saved at: {pairs_path}")
+
+    # Load the compiled emoji sentiment lexicon (compiled again if the emoji sentiment data changed)
+    lexicon = load_emoji_lexicon(lexicon_path, input_path_emoji)
 
-    print("Unique vals of sentiment label", emoji_df['sentiment_label'].unique())
-    compute_emoji_sentiment(input_folder_sentiment, input_dir, emoji_df, output_folder_sentiment)
+    print("Unique vals of sentiment label", sorted(set(lexicon.values())))
+    compute_emoji_sentiment(period, lexicon, output_folder_sentiment)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
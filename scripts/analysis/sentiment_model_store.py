@@ -0,0 +1,172 @@
+import hashlib
+import json
+import multiprocessing
+import os
+import time
+from contextlib import contextmanager
+import pandas as pd
+import config_analysis as config
+
+WARMUP_TEXTS = ["Das ist ein kurzer Kommentar.", "Endlich wieder gute Politik, vielen Dank für das Video!"]
+
+def hash_file(path, chunk_size=1 << 20):
+    """Returns the sha256 hash of a file."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def load_registry(registry_path):
+    """Loads the model registry (model name -> local path and file hashes), empty if it does not exist."""
+    if not registry_path or not os.path.exists(registry_path):
+        return {}
+    with open(registry_path, encoding="utf-8") as f:
+        return json.load(f)
+
+def save_registry(registry, registry_path):
+    """Saves the model registry as JSON."""
+    os.makedirs(os.path.dirname(registry_path) or ".", exist_ok=True)
+    with open(registry_path, "w", encoding="utf-8") as f:
+        json.dump(registry, f, indent=2)
+
+def file_stats(entry):
+    """Returns size and modification time of every pinned file, None for missing files."""
+    stats = {}
+    for name in entry["files"]:
+        path = os.path.join(entry["path"], name)
+        stats[name] = [os.path.getsize(path), os.stat(path).st_mtime_ns] if os.path.exists(path) else None
+    return stats
+
+def get_registered_model(registry_path, model_name):
+    """Returns the registry entry of the model or None if the model is not in the store."""
+    entry = load_registry(registry_path).get(model_name)
+    if entry and os.path.isdir(entry["path"]):
+        return entry
+    return None
+
+def install_model(model_name, store_dir, registry_path):
+    """Downloads the model and tokenizer once, saves them as safetensors and pins path and file hashes in the registry."""
+    from germansentiment import SentimentModel
+    model_dir = os.path.join(store_dir, model_name.replace("/", "__"))
+    os.makedirs(model_dir, exist_ok=True)
+    reference = SentimentModel(model_name)
+    # safetensors can be memory-mapped when loading
+    reference.model.save_pretrained(model_dir, safe_serialization=True)
+    reference.tokenizer.save_pretrained(model_dir)
+    files = {name: hash_file(os.path.join(model_dir, name)) for name in sorted(os.listdir(model_dir))}
+    entry = {"path": model_dir, "files": files}
+    # size and modification time of the hashed files for the quick check when loading
+    entry["stats"] = file_stats(entry)
+
+    registry = load_registry(registry_path)
+    registry[model_name] = entry
+    save_registry(registry, registry_path)
+    print(f"Model {model_name} saved at: {model_dir}")
+    return entry
+
+def verify_model(entry):
+    """Compares the files in the store with the pinned hashes and raises a ValueError on a mismatch."""
+    for name, expected in entry["files"].items():
+        path = os.path.join(entry["path"], name)
+        if not os.path.exists(path) or hash_file(path) != expected:
+            raise ValueError(f"Model file {path} does not match the hash in the registry.")
+
+def check_model(entry):
+    """Compares size and modification time of the files with those recorded at the last hash check, raises a ValueError
+    if a file changed since then (the hashes are checked again by running sentiment_model_store.py)."""
+    if entry.get("stats") != file_stats(entry):
+        raise ValueError(f"Model files in {entry['path']} changed since their hashes were checked, "
+                         f"run sentiment_model_store.py to check them again.")
+
+@contextmanager
+def offline_mode():
+    """Stops transformers and huggingface_hub from contacting the Hugging Face Hub within the block."""
+    import huggingface_hub.constants
+    previous = {name: os.environ.get(name) for name in ("HF_HUB_OFFLINE", "TRANSFORMERS_OFFLINE")}
+    previous_flag = huggingface_hub.constants.HF_HUB_OFFLINE
+    os.environ.update({name: "1" for name in previous})
+    # the flag is read when huggingface_hub is imported, which may have happened already
+    huggingface_hub.constants.HF_HUB_OFFLINE = True
+    try:
+        yield
+    finally:
+        huggingface_hub.constants.HF_HUB_OFFLINE = previous_flag
+        for name, value in previous.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+def load_stored_model(entry):
+    """Loads the sentiment model from the store without contacting the Hub, raises a ValueError if a file changed since its hash was checked."""
+    from germansentiment import SentimentModel
+    check_model(entry)
+    # a local folder is loaded directly, the safetensors weights are memory-mapped
+    with offline_mode():
+        return SentimentModel(entry["path"])
+
+def warm_up(model, batch_size=8):
+    """Runs one small batch through the model so the first real batch does not pay for the initialisation."""
+    texts = (WARMUP_TEXTS * batch_size)[:batch_size]
+    model.predict_sentiment(texts)
+
+def measure_cold_start(task):
+    """Measures the time from a fresh process to the first scored batch, for the Hugging Face cache or the local store."""
+    source, texts, warmup = task
+    start = time.perf_counter()
+    from germansentiment import SentimentModel
+    imported = time.perf_counter()
+    if source == "store":
+        model = load_stored_model(get_registered_model(config.sentiment_model_registry, config.sentiment_model_name))
+    else:
+        model = SentimentModel(config.sentiment_model_name)
+    loaded = time.perf_counter()
+    if warmup:
+        warm_up(model)
+    warmed = time.perf_counter()
+    model.predict_sentiment(texts)
+    scored = time.perf_counter()
+    return {
+        "source": source,
+        "warmup": warmup,
+        "import_s": round(imported - start, 2),
+        "load_s": round(loaded - imported, 2),
+        "warmup_s": round(warmed - loaded, 2),
+        "first_batch_s": round(scored - warmed, 2),
+        "cold_start_s": round(scored - start, 2)
+    }
+
+def main():
+    # configurations
+    registry_path = config.sentiment_model_registry
+    store_dir = config.sentiment_model_store
+    model_name = config.sentiment_model_name
+    output_path = "results/sentiment_analysis/cold_start.csv"
+    batch_size = config.sentiment_batch_size
+
+    entry = get_registered_model(registry_path, model_name)
+    if entry is None:
+        entry = install_model(model_name, store_dir, registry_path)
+    # full hash check, loading the model afterwards only compares size and modification time
+    verify_model(entry)
+    registry = load_registry(registry_path)
+    registry[model_name]["stats"] = file_stats(entry)
+    save_registry(registry, registry_path)
+    print(f"Model {model_name} in {entry['path']} matches the registry hashes.")
+
+    # every measurement runs in a fresh process
+    texts = (WARMUP_TEXTS * batch_size)[:batch_size]
+    tasks = [(source, texts, warmup) for source in ["huggingface", "store"] for warmup in [False, True]]
+    with multiprocessing.get_context("spawn").Pool(1, maxtasksperchild=1) as pool:
+        results = list(pool.imap(measure_cold_start, tasks))
+
+    df_results = pd.DataFrame(results)
+    print("Cold start to the first scored batch:")
+    print(df_results.to_string(index=False))
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    df_results.to_csv(output_path, index=False)
+    print(f"Cold start results saved at: {output_path}")
+
+if __name__ == "__main__":
+    main()
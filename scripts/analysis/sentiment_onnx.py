@@ -0,0 +1,141 @@
+import json
+import os
+import re
+import numpy as np
+import pandas as pd
+import torch
+import onnxruntime as ort
+from onnxruntime.quantization import quantize_dynamic, QuantType
+from transformers import AutoConfig, AutoTokenizer
+from germansentiment import SentimentModel
+import config_analysis as config
+from sentiment_analysis import compute_sentiments, has_words
+from sentiment_benchmark import load_sample_texts
+
+ONNX_INPUTS = ["input_ids", "attention_mask", "token_type_ids"]
+# compiled patterns of SentimentModel used by its clean_text, saved from the library with the export
+CLEANING_PATTERNS = ["clean_chars", "clean_http_urls", "clean_at_mentions"]
+
+def export_onnx(model_name, output_dir, quantize=True):
+    """Exports the sentiment model with its tokenizer to ONNX, optionally also as dynamically int8-quantized model."""
+    os.makedirs(output_dir, exist_ok=True)
+    reference = SentimentModel(model_name)
+    model = reference.model.to("cpu").eval()
+    dummy = reference.tokenizer(["das ist ein test"], return_tensors="pt")
+    onnx_path = os.path.join(output_dir, "model.onnx")
+    # batch size and sequence length stay variable in the exported model
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in ONNX_INPUTS}
+    dynamic_axes["logits"] = {0: "batch"}
+    torch.onnx.export(
+        model,
+        tuple(dummy[name] for name in ONNX_INPUTS),
+        onnx_path,
+        input_names=ONNX_INPUTS,
+        output_names=["logits"],
+        dynamic_axes=dynamic_axes,
+        opset_version=17,
+        dynamo=False
+    )
+    # tokenizer and config (labels) are loaded from the same folder
+    reference.tokenizer.save_pretrained(output_dir)
+    model.config.save_pretrained(output_dir)
+    # text cleaning of the installed germansentiment version, so both backends score the same cleaned texts
+    patterns = {name: [getattr(reference, name).pattern, getattr(reference, name).flags] for name in CLEANING_PATTERNS}
+    with open(os.path.join(output_dir, "cleaning.json"), "w", encoding="utf-8") as f:
+        json.dump(patterns, f, ensure_ascii=False, indent=2)
+    print(f"ONNX model saved at: {onnx_path}")
+    if quantize:
+        quantized_path = os.path.join(output_dir, "model_int8.onnx")
+        quantize_dynamic(onnx_path, quantized_path, weight_type=QuantType.QInt8)
+        print(f"Quantized ONNX model saved at: {quantized_path}")
+
+class OnnxSentimentModel(SentimentModel):
+    """Runs the exported sentiment model with ONNX Runtime, with the same interface and text cleaning as SentimentModel."""
+
+    def __init__(self, model_dir, quantized=False, num_threads=None):
+        self.device = "cpu"
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.id2label = AutoConfig.from_pretrained(model_dir).id2label
+
+        options = ort.SessionOptions()
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        model_file = "model_int8.onnx" if quantized else "model.onnx"
+        self.session = ort.InferenceSession(os.path.join(model_dir, model_file), options, providers=["CPUExecutionProvider"])
+        self.input_names = [node.name for node in self.session.get_inputs()]
+
+        # clean_text of SentimentModel with the patterns of the library saved at the export
+        cleaning_path = os.path.join(model_dir, "cleaning.json")
+        if not os.path.exists(cleaning_path):
+            raise FileNotFoundError(f"{cleaning_path} not found, export the model again with sentiment_onnx.py.")
+        with open(cleaning_path, encoding="utf-8") as f:
+            for name, (pattern, flags) in json.load(f).items():
+                setattr(self, name, re.compile(pattern, flags))
+
+    def predict_sentiment(self, texts, output_probabilities=False):
+        texts = [self.clean_text(text) for text in texts]
+        encoded = self.tokenizer(texts, padding=True, add_special_tokens=True, truncation=True, return_tensors="np")
+        return self.predict_encoded(encoded, output_probabilities)
+
+    def predict_encoded(self, encoded, output_probabilities=False):
+        """Scores tokenizer output (numpy arrays), also used for texts truncated to token ids."""
+        inputs = {name: encoded[name].astype(np.int64) for name in self.input_names}
+        logits = self.session.run(["logits"], inputs)[0]
+        labels = [self.id2label[int(label_id)] for label_id in logits.argmax(axis=1)]
+        if not output_probabilities:
+            return labels
+        # softmax over the classes
+        exp = np.exp(logits - logits.max(axis=1, keepdims=True))
+        predictions = exp / exp.sum(axis=1, keepdims=True)
+        probabilities = [[[self.id2label[index], float(item)] for index, item in enumerate(prediction)] for prediction in predictions]
+        return labels, probabilities
+
+def agreement_report(texts, reference_model, candidate_model, batch_size, max_tokens):
+    """Compares the labels of two models on the texts with words and returns the agreement rate and the confusion table."""
+    # texts without words are skipped by both models and would count as matches
+    texts = [text for text in texts if isinstance(text, str) and has_words(reference_model.clean_text(text))]
+    reference = compute_sentiments(texts, reference_model, batch_size, max_tokens)
+    candidate = compute_sentiments(texts, candidate_model, batch_size, max_tokens)
+    df = pd.DataFrame({"reference": reference, "candidate": candidate})
+    df["match"] = df["reference"] == df["candidate"]
+    agreement = df["match"].mean()
+    confusion = pd.crosstab(df["reference"], df["candidate"], rownames=["Referenz (torch)"], colnames=["Kandidat"])
+    # share of texts of each reference class that got the same label
+    per_class = df.groupby("reference")["match"].mean()
+    return agreement, confusion, per_class
+
+def main():
+    # configurations
+    start_date = config.start_date
+    end_date = config.end_date
+    input_pattern = f"data/data_preprocessed/comments/*_comments_{start_date}_{end_date}_preprocessed.csv"
+    output_dir = "results/sentiment_analysis"
+    sample_size = 5000
+    model_dir = config.sentiment_onnx_dir
+
+    if not all(os.path.exists(os.path.join(model_dir, name)) for name in ("model.onnx", "cleaning.json")):
+        export_onnx(config.sentiment_model_name, model_dir, quantize=True)
+
+    texts = load_sample_texts(input_pattern, sample_size)
+    if not texts:
+        print(f"No comments found for {input_pattern}.")
+        return
+
+    reference_model = SentimentModel(config.sentiment_model_name)
+    for backend, quantized in [("onnx", False), ("onnx_int8", True)]:
+        candidate_model = OnnxSentimentModel(model_dir, quantized=quantized)
+        agreement, confusion, per_class = agreement_report(
+            texts, reference_model, candidate_model, config.sentiment_batch_size, config.sentiment_max_batch_tokens
+        )
+        print(f"\nBackend {backend}: label agreement with torch {agreement:.2%} on {confusion.to_numpy().sum()} scored comments")
+        print("Agreement per class:")
+        print(per_class.round(4))
+        print("Confusion:")
+        print(confusion)
+        confusion_path = os.path.join(output_dir, f"agreement_{backend}.csv")
+        os.makedirs(output_dir, exist_ok=True)
+        confusion.to_csv(confusion_path)
+        print(f"Confusion table saved at: {confusion_path}")
+
+if __name__ == "__main__":
+    main()
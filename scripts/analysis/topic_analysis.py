@@ -1,10 +1,18 @@
+import asyncio
+import json
+import math
 import pandas as pd
 import os
+import random
+import sys
 import config_analysis as config
-import openai
-
-# set API key for OpenAI here
-openai.api_key = API_KEY
+from dotenv import load_dotenv
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'common')))
+from dataset_catalog import find_file, list_accounts, make_period
+from topic_batch import run_batch
+from topic_embeddings import labeled_data_hash, pre_classify_videos, report_local_agreement
+from topic_prompt import compress_video_text, report_prompt_tokens
+from topic_requests import print_request_stats, run_requests
 
 def get_party(username):
     """Returns the party of the user based on their username."""
@@ -19,60 +27,229 @@ def get_party(username):
     elif username in config.linke_usernames:
         return "Linke"
 
-def gpt_topic_classification(description, transcript, party):
-    """Send request to fine-tuned GPT-4.1-nano model to classify the topic"""
-    # define the prompt
+def build_topic_prompt(description, transcript, party):
+    """Builds the prompt for the fine-tuned GPT-4.1-nano model, empty description or transcript are left out"""
     prompt = (
         "Ordne das folgende TikTok-Video in einen dieser Themenbereiche ein: Soziales & Arbeit, Wirtschaft & Finanzen, Sicherheit & Ordnung, Migration, Umwelt & Energie, Internationale Politik, Persönliches, Wahlkampf.\n"
         "Gib nur den ausgewählten Themenbereich zurück, ohne Erklärung.\n"
-        f"Beschreibung: {description}\n"
-        f"Transkript: {transcript}\n"
-        f"Partei: {party}\n"
     )
-    print(prompt)
+    if description:
+        prompt += f"Beschreibung: {description}\n"
+    if transcript:
+        prompt += f"Transkript: {transcript}\n"
+    return prompt + f"Partei: {party}\n"
+
+def compress_videos(videos, budget=None):
+    """Returns description, transcript and party of each video with the texts shortened to the token budget"""
+    video_texts = []
+    for _, row in videos.iterrows():
+        description, transcript = compress_video_text(row["video_description"], row["voice_to_text"], budget)
+        video_texts.append((description, transcript, row["party"]))
+    return video_texts
+
+def build_packed_prompt(video_texts):
+    """Builds one prompt for several videos, the answer is a JSON object with the topic of each video number"""
+    prompt = (
+        "Ordne jedes der folgenden TikTok-Videos in einen dieser Themenbereiche ein: Soziales & Arbeit, Wirtschaft & Finanzen, Sicherheit & Ordnung, Migration, Umwelt & Energie, Internationale Politik, Persönliches, Wahlkampf.\n"
+        "Gib nur ein JSON-Objekt zurück, das jeder Videonummer den ausgewählten Themenbereich zuordnet, ohne Erklärung, z. B. {\"1\": \"Migration\", \"2\": \"Wahlkampf\"}.\n"
+    )
+    for number, (description, transcript, party) in enumerate(video_texts, start=1):
+        prompt += f"\nVideo {number}:\n"
+        if description:
+            prompt += f"Beschreibung: {description}\n"
+        if transcript:
+            prompt += f"Transkript: {transcript}\n"
+        prompt += f"Partei: {party}\n"
+    return prompt
+
+def make_packs(video_texts, pack_size):
+    """Splits the videos into packs of pack_size videos and returns the video indices and the prompt of each pack"""
+    packs = [list(range(start, min(start + pack_size, len(video_texts)))) for start in range(0, len(video_texts), pack_size)]
+    return packs, [build_packed_prompt([video_texts[i] for i in pack]) for pack in packs]
+
+def parse_packed_answer(answer, size):
+    """Returns the topic of each video of a pack, None for video numbers missing in the JSON answer"""
     try:
-        # send request
-        response = openai.Completion.create(
-            model="ft:gpt-4.1-nano-2025-04-14:caro-haensch:reginav2:BoWObdmF",
-            prompt=prompt,
-            max_tokens=10,
-            temperature=0.0
-        )
-        return response.choices[0].text
-    except Exception as e:
-        print(f"Error for query: {e}")
-        return("ERROR")
+        topics = json.loads(answer[answer.index("{"):answer.rindex("}") + 1])
+    except ValueError:
+        return [None] * size
+    if not isinstance(topics, dict):
+        return [None] * size
+    result = []
+    for number in range(1, size + 1):
+        topic = topics.get(str(number))
+        result.append(topic.strip() if isinstance(topic, str) and topic.strip() else None)
+    return result
 
-def main():
-    # configurations
-    folder = "data/data_preprocessed/videos"
-    all_files = [os.path.join(folder, f) for f in os.listdir(folder) if f.endswith(".csv")]
+def gpt_topic_classification(prompts, stats, on_answer=None, max_tokens=None):
+    """Send requests to fine-tuned GPT-4.1-nano model to classify the topic of each video, concurrently and rate limited or as batch job"""
+    if config.topic_mode == "batch":
+        return run_batch(prompts, stats, on_answer=on_answer, max_tokens=max_tokens)
+    return asyncio.run(run_requests(prompts, stats, on_answer=on_answer, max_tokens=max_tokens))
+
+def classify_packed(video_texts, stats, on_answer=None):
+    """Classifies topic_pack_size videos per request, videos of failed or partial packs are sent again one by one"""
+    packs, packed_prompts = make_packs(video_texts, config.topic_pack_size)
+    topics = [None] * len(video_texts)
+
+    def save_pack(p, answer):
+        for i, topic in zip(packs[p], parse_packed_answer(answer, len(packs[p]))):
+            if topic is not None:
+                topics[i] = topic
+                if on_answer:
+                    on_answer(i, topic)
+
+    gpt_topic_classification(packed_prompts, stats, on_answer=save_pack, max_tokens=config.topic_pack_size * config.topic_pack_answer_tokens)
+
+    # videos without a valid answer in their pack
+    failed = [i for i, topic in enumerate(topics) if topic is None]
+    stats["requeued"] = stats.get("requeued", 0) + len(failed)
+    if failed:
+        print(f"{len(failed)} videos without a valid answer in their pack, classifying them one by one...")
+
+        def save_single(j, answer):
+            topics[failed[j]] = answer
+            if on_answer:
+                on_answer(failed[j], answer)
+
+        gpt_topic_classification([build_topic_prompt(*video_texts[i]) for i in failed], stats, on_answer=save_single)
+    return [topic or "ERROR" for topic in topics]
+
+def topic_settings(source):
+    """Returns the settings that decide the topic of a video, saved with every checkpoint entry of the source (gpt or local)."""
+    if source == "local":
+        return {"embedding_model": config.topic_embedding_model, "margin": config.topic_local_margin, "training_data": labeled_data_hash()}
+    return {
+        "model": config.topic_model_name,
+        "temperature": config.topic_temperature,
+        "max_tokens": config.topic_max_tokens,
+        "video_token_budget": config.topic_video_token_budget,
+        "pack_size": config.topic_pack_size,
+        "pack_answer_tokens": config.topic_pack_answer_tokens
+    }
+
+def matching_entries(entries):
+    """Returns the checkpoint entries classified with the settings of the current run."""
+    return {video_id: entry for video_id, entry in entries.items() if entry.get("settings") == topic_settings(entry.get("source", "gpt"))}
+
+def load_videos(period):
+    """Loads the preprocessed videos of all users in the period and assigns the party"""
     dfs = []
-    # get videos of each user and assign party
-    for file in all_files:
+    for username in list_accounts(period, "videos"):
+        file = find_file(username, period, "videos")
         df = pd.read_csv(file, engine='python', on_bad_lines='warn')
-        basename = os.path.basename(file)
-        username = basename.split("_video_data")[0]
         df["username"] = username
         df["party"] = df["username"].apply(get_party)
         dfs.append(df)
     all_videos = pd.concat(dfs, ignore_index=True)
-    all_videos = all_videos[["id", "username", "party", "video_description", "voice_to_text"]]
+    return all_videos[["id", "username", "party", "video_description", "voice_to_text"]]
+
+def load_topic_checkpoint(checkpoint_path):
+    """Loads the entries of all videos classified so far as dict video id -> entry with topic and source."""
+    entries = {}
+    if not os.path.exists(checkpoint_path):
+        return entries
+    with open(checkpoint_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                # last line of a run that crashed while writing
+                continue
+            entries[entry["id"]] = entry
+    return entries
+
+def append_topic_checkpoint(checkpoint, video_id, topic, source="gpt", **details):
+    """Appends the topic of one video with the settings of the run (and details like the LLM answer of a checked local topic)
+    to the checkpoint file and writes it to disk at once."""
+    entry = {"id": video_id, "gpt_topic": topic, "source": source, "settings": topic_settings(source), **details}
+    checkpoint.write(json.dumps(entry, ensure_ascii=False) + "\n")
+    checkpoint.flush()
+    os.fsync(checkpoint.fileno())
+
+def main():
+    # configurations
+    load_dotenv()
+    if config.topic_local_classifier and config.topic_local_audit_share <= 0:
+        raise ValueError("topic_local_audit_share must be more than 0 with the local classifier, the agreement of the local topics with the LLM is reported from the checked videos.")
+    period = make_period(config.start_date, config.end_date)
+    all_videos = load_videos(period)
 
     output_dir = f"results/topic_analysis/{config.start_date}_{config.end_date}"
-    os.makedirs(output_dir, exist_ok=True)
+    checkpoint_path = os.path.join(output_dir, "checkpoints", "gpt_topic.jsonl")
+    os.makedirs(os.path.dirname(checkpoint_path), exist_ok=True)
+
+    # resume after the videos classified in an earlier run with the same settings, the others are classified again
+    entries = load_topic_checkpoint(checkpoint_path)
+    done = matching_entries(entries)
+    if len(done) < len(entries):
+        print(f"Warning: {len(entries) - len(done)} videos in the checkpoint were classified with other settings "
+              f"(model, temperature, token budget, pack size, local classifier or its labelled videos), they are classified again.")
+    todo = all_videos[~all_videos["id"].isin(done)]
+    if done:
+        print(f"Resuming: {len(all_videos) - len(todo)} videos already classified, {len(todo)} left.")
+
+    # local pre-classification, the LLM gets the videos without a clear topic and a sample of the local topics
+    video_texts = compress_videos(todo, config.topic_video_token_budget)
+    local_topics = pre_classify_videos(video_texts) if config.topic_local_classifier and video_texts else {}
+    audit = random.Random(42).sample(sorted(local_topics), math.ceil(len(local_topics) * config.topic_local_audit_share))
+    gpt_indices = [i for i in range(len(video_texts)) if i not in local_topics] + audit
+    if local_topics:
+        print(f"Local classifier: {len(local_topics)} of {len(video_texts)} videos assigned locally ({len(local_topics) / len(video_texts):.2%}), "
+              f"{len(video_texts) - len(local_topics)} sent to the LLM, {len(audit)} local topics checked by the LLM")
+
+    # prompts within the token budget, compared with the full texts before the run
+    gpt_texts = [video_texts[i] for i in gpt_indices]
+    prompts = [build_topic_prompt(*texts) for texts in gpt_texts]
+    raw_prompts = [
+        build_topic_prompt(str(row["video_description"]), str(row["voice_to_text"]), row["party"])
+        for _, row in todo.iloc[gpt_indices].iterrows()
+    ]
+    runs = [("without budget", raw_prompts, config.topic_max_tokens), ("with budget", prompts, config.topic_max_tokens)]
+    if config.topic_pack_size > 1:
+        packed_prompts = make_packs(gpt_texts, config.topic_pack_size)[1]
+        runs.append((f"with budget, {config.topic_pack_size} videos per prompt", packed_prompts, config.topic_pack_size * config.topic_pack_answer_tokens))
+    report_prompt_tokens(runs)
+
+    # get topic classification, every answer is appended to the checkpoint (failed requests are sent again next run)
+    stats = {}
+    todo_ids = todo["id"].tolist()
+    audited = set(audit)
+    with open(checkpoint_path, "a", encoding="utf-8") as checkpoint:
+        # checked local topics are saved together with the LLM answer (classified again next run if the answer fails)
+        for i, (topic, similarity, margin) in local_topics.items():
+            if i not in audited:
+                append_topic_checkpoint(checkpoint, todo_ids[i], topic, "local", similarity=similarity, margin=margin)
+
+        def save_answer(j, answer):
+            i = gpt_indices[j]
+            if i in local_topics:
+                topic, similarity, margin = local_topics[i]
+                append_topic_checkpoint(checkpoint, todo_ids[i], topic, "local", similarity=similarity, margin=margin, audit_topic=answer)
+            else:
+                append_topic_checkpoint(checkpoint, todo_ids[i], answer)
+
+        if config.topic_pack_size > 1:
+            classify_packed(gpt_texts, stats, on_answer=save_answer)
+        else:
+            gpt_topic_classification(prompts, stats, on_answer=save_answer)
+    print_request_stats(stats)
+    entries = matching_entries(load_topic_checkpoint(checkpoint_path))
+
+    # agreement of all local topics checked by the LLM so far, also in earlier runs
+    audit_entries = [
+        {"id": video_id, "local_topic": entry["gpt_topic"], "gpt_topic": entry["audit_topic"],
+         "similarity": entry["similarity"], "margin": entry["margin"]}
+        for video_id, entry in entries.items() if "audit_topic" in entry
+    ]
+    if audit_entries:
+        report_local_agreement(audit_entries, os.path.join(output_dir, "local_topic_agreement.csv"))
 
-    # process videos of each party
+    # assemble the videos of each party from the checkpoint entries of the current settings
+    all_videos["gpt_topic"] = all_videos["id"].map({video_id: entry["gpt_topic"] for video_id, entry in entries.items()}).fillna("ERROR")
+    all_videos["topic_source"] = all_videos["id"].map({video_id: entry.get("source", "gpt") for video_id, entry in entries.items()})
     for party in all_videos["party"].unique():
-        party_df = all_videos[all_videos["party"] == party].copy()
-        results = []
-        for idx, row in party_df.iterrows():
-            description = str(row["video_description"])
-            transcript = str(row["voice_to_text"])
-            # get topic classification
-            gpt_response = gpt_topic_classification(description, transcript, party)
-            results.append(gpt_response)
-        party_df["gpt_topic"] = results
+        party_df = all_videos[all_videos["party"] == party]
         party_df.to_csv(os.path.join(output_dir, f"{party}.csv"), index=False)
         print(f"Done: {party}")
 
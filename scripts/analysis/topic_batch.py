@@ -0,0 +1,121 @@
+import glob
+import json
+import os
+import time
+import openai
+from openai.types import Completion
+import config_analysis as config
+from topic_requests import get_api_key, prepare_prompts, report_answer, save_answer
+
+FINISHED_STATUSES = ("completed", "failed", "expired", "cancelled")
+
+def make_batch_client():
+    """Creates the OpenAI client for the Batch API."""
+    return openai.OpenAI(api_key=get_api_key(), base_url=config.topic_api_base_url, timeout=config.topic_timeout)
+
+def write_batch_file(pending, path, max_tokens):
+    """Writes one completion request per prompt as JSONL batch file, the cache key of the prompt is the custom id."""
+    with open(path, "w", encoding="utf-8") as f:
+        for key, prompt in pending.items():
+            request = {
+                "custom_id": key,
+                "method": "POST",
+                "url": "/v1/completions",
+                "body": {
+                    "model": config.topic_model_name,
+                    "prompt": prompt,
+                    "max_tokens": max_tokens,
+                    "temperature": config.topic_temperature
+                }
+            }
+            f.write(json.dumps(request, ensure_ascii=False) + "\n")
+
+def submit_batch(client, path, batch_dir):
+    """Uploads and removes the batch file, creates the batch and saves its id, so a crashed run can pick it up again."""
+    try:
+        with open(path, "rb") as f:
+            batch_file = client.files.create(file=f, purpose="batch")
+    finally:
+        # the next run writes the pending prompts again if the upload failed
+        os.remove(path)
+    batch = client.batches.create(input_file_id=batch_file.id, endpoint="/v1/completions", completion_window="24h")
+    with open(os.path.join(batch_dir, f"{batch.id}.json"), "w", encoding="utf-8") as f:
+        json.dump({"batch_id": batch.id}, f)
+    return batch.id
+
+def wait_for_batch(client, batch_id, poll_interval):
+    """Polls the batch until it is finished and returns it."""
+    while True:
+        batch = client.batches.retrieve(batch_id)
+        if batch.status in FINISHED_STATUSES:
+            print(f"Batch {batch_id}: {batch.status}")
+            return batch
+        counts = batch.request_counts
+        progress = f" ({counts.completed + counts.failed} of {counts.total} requests)" if counts else ""
+        print(f"Batch {batch_id}: {batch.status}{progress}")
+        time.sleep(poll_interval)
+
+def read_batch_results(client, batch):
+    """Returns dict custom id -> completion for the successful requests of a finished batch (also expired or cancelled)."""
+    results = {}
+    if batch.output_file_id is None:
+        return results
+    for line in client.files.content(batch.output_file_id).text.splitlines():
+        entry = json.loads(line)
+        response = entry.get("response")
+        if response and response.get("status_code") == 200:
+            results[entry["custom_id"]] = Completion.model_validate(response["body"])
+    return results
+
+def collect_batch(client, batch_id, batch_dir, conn, answers, stats):
+    """Waits for a batch, keeps its answers and removes the saved batch id."""
+    batch = wait_for_batch(client, batch_id, config.topic_batch_poll_interval)
+    results = read_batch_results(client, batch)
+    for key, response in results.items():
+        save_answer(conn, answers, key, response)
+        if response.usage is not None:
+            stats["prompt_tokens"] = stats.get("prompt_tokens", 0) + response.usage.prompt_tokens
+            stats["completion_tokens"] = stats.get("completion_tokens", 0) + response.usage.completion_tokens
+    stats["requests"] = stats.get("requests", 0) + len(results)
+    if batch.request_counts:
+        stats["errors"] = stats.get("errors", 0) + batch.request_counts.failed
+    os.remove(os.path.join(batch_dir, f"{batch_id}.json"))
+    return results
+
+def run_batch(prompts, stats, client=None, on_answer=None, max_tokens=None):
+    """Classifies the prompts with the Batch API and returns the answers in the order of the prompts.
+
+    Cache, duplicate handling and on_answer work as in run_requests. Batches of a crashed run are collected first.
+    """
+    max_tokens = max_tokens or config.topic_max_tokens
+    keys, positions, answers, pending, conn = prepare_prompts(prompts, stats, max_tokens)
+    client = client or make_batch_client()
+    batch_dir = config.topic_batch_dir
+    os.makedirs(batch_dir, exist_ok=True)
+    start = time.perf_counter()
+    try:
+        # answers of batches submitted by an earlier run
+        for path in sorted(glob.glob(os.path.join(batch_dir, "*.json"))):
+            with open(path, encoding="utf-8") as f:
+                batch_id = json.load(f)["batch_id"]
+            print(f"Collecting batch {batch_id} of an earlier run...")
+            collect_batch(client, batch_id, batch_dir, conn, answers, stats)
+        pending = {key: prompt for key, prompt in pending.items() if key not in answers}
+        for key in positions:
+            if key in answers:
+                report_answer(on_answer, positions, answers, key)
+
+        if pending:
+            path = os.path.join(batch_dir, f"batch_{time.strftime('%Y%m%d_%H%M%S')}.jsonl")
+            write_batch_file(pending, path, max_tokens)
+            batch_id = submit_batch(client, path, batch_dir)
+            print(f"Batch {batch_id} submitted with {len(pending)} requests.")
+            results = collect_batch(client, batch_id, batch_dir, conn, answers, stats)
+            for key in results:
+                if key in positions:
+                    report_answer(on_answer, positions, answers, key)
+    finally:
+        if conn:
+            conn.close()
+    stats["duration"] = stats.get("duration", 0) + time.perf_counter() - start
+    return [answers.get(key, "ERROR") for key in keys]
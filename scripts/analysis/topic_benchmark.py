@@ -0,0 +1,127 @@
+import asyncio
+import os
+import sys
+import numpy as np
+import pandas as pd
+import config_analysis as config
+from dotenv import load_dotenv
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'common')))
+from dataset_catalog import make_period
+from topic_analysis import build_topic_prompt, classify_packed, compress_videos, load_videos
+from topic_requests import run_requests
+from topic_standin_server import start_standin_server
+
+def make_synthetic_videos(sample_size, seed=42):
+    """Creates description, transcript and party of videos with random texts of realistic length."""
+    rng = np.random.default_rng(seed)
+    words = ["rente", "migration", "klima", "steuern", "wahlkampf", "sicherheit", "ukraine", "arbeit", "energie", "familie"]
+    video_texts = []
+    for i in range(sample_size):
+        description = " ".join(rng.choice(words, size=rng.integers(5, 30))) + f" #{i}"
+        transcript = " ".join(rng.choice(words, size=rng.integers(20, 300)))
+        video_texts.append((description, transcript, "SPD"))
+    return video_texts
+
+def load_sample_videos(sample_size, seed=42):
+    """Returns description, transcript and party of a random sample of the preprocessed videos within the token budget."""
+    videos = load_videos(make_period(config.start_date, config.end_date))
+    videos = videos.sample(n=min(sample_size, len(videos)), random_state=seed)
+    return compress_videos(videos, config.topic_video_token_budget)
+
+def run_benchmark(prompts, concurrency, base_url):
+    """Classifies the prompts against the stand-in server with the given concurrency and returns the throughput."""
+    config.topic_api_base_url = base_url
+    config.topic_concurrency = concurrency
+    # every concurrency level sends all prompts
+    config.topic_cache_path = None
+    stats = {}
+    answers = asyncio.run(run_requests(prompts, stats))
+    return {
+        "concurrency": concurrency,
+        "requests": stats.get("requests", 0),
+        "retries": stats.get("retries", 0),
+        "errors": stats.get("errors", 0),
+        "duration_s": round(stats["duration"], 2),
+        "requests_per_sec": round(len(prompts) / stats["duration"], 1),
+        "answered": sum(answer != "ERROR" for answer in answers)
+    }
+
+def run_pack_benchmark(video_texts, pack_size, reference, endpoint):
+    """Classifies the videos in packs of pack_size videos and compares the topics with the answers of single prompts.
+
+    Against the stand-in server the answers are hashes of the video text, so the comparison only checks the parsing
+    of packed answers (parser_check), only the api endpoint measures the agreement of the model.
+    """
+    config.topic_pack_size = pack_size
+    stats = {}
+    topics = classify_packed(video_texts, stats)
+    agreement = np.mean([topic == answer for topic, answer in zip(topics, reference)])
+    return {
+        "pack_size": pack_size,
+        "requests": stats.get("requests", 0),
+        "requeued": stats.get("requeued", 0),
+        "prompt_tokens": stats.get("prompt_tokens", 0),
+        "completion_tokens": stats.get("completion_tokens", 0),
+        "duration_s": round(stats["duration"], 2),
+        "videos_per_sec": round(len(video_texts) / stats["duration"], 1),
+        "agreement" if endpoint == "api" else "parser_check": round(agreement, 4)
+    }
+
+def main():
+    # configurations
+    output_path = "results/topic_analysis/topic_benchmark.csv"
+    pack_output_path = "results/topic_analysis/topic_pack_benchmark.csv"
+    sample_size = 300
+    latency = 0.3 # seconds per request of the stand-in server
+    token_latency = 0.01 # seconds per answer token of the stand-in server
+    error_rate = 0.02 # share of requests answered with 429
+    answer_error_rate = 0.01 # share of videos left out of packed answers
+    concurrency_levels = [1, 4, 16, 64]
+    pack_sizes = [1, 5, 10, 20]
+    pack_concurrency = 4 # concurrency of the pack size comparison
+    pack_endpoint = config.topic_pack_benchmark_endpoint
+    pack_sample_size = config.topic_pack_benchmark_sample
+    api_base_url = config.topic_api_base_url
+
+    server = start_standin_server(latency=latency, error_rate=error_rate, token_latency=token_latency, answer_error_rate=answer_error_rate)
+    base_url = f"http://127.0.0.1:{server.server_address[1]}/v1"
+    video_texts = make_synthetic_videos(sample_size)
+    prompts = [build_topic_prompt(*texts) for texts in video_texts]
+    print(f"Classifying {sample_size} prompts against the stand-in server ({latency} s latency, {error_rate:.0%} errors)...")
+
+    results = []
+    for concurrency in concurrency_levels:
+        result = run_benchmark(prompts, concurrency, base_url)
+        results.append(result)
+        print(f"Concurrency {concurrency}: {result['requests_per_sec']} requests/sec, {result['retries']} retries")
+
+    # several videos per prompt, real videos and the fine-tuned model only with the api endpoint
+    config.topic_concurrency = pack_concurrency
+    if pack_endpoint == "api":
+        load_dotenv()
+        config.topic_api_base_url = api_base_url
+        video_texts = load_sample_videos(pack_sample_size)
+        prompts = [build_topic_prompt(*texts) for texts in video_texts]
+        print(f"Comparing pack sizes on {len(video_texts)} real videos against {api_base_url or 'the OpenAI API'}...")
+    else:
+        print("Comparing pack sizes against the stand-in server, the agreement only checks the parsing of packed answers...")
+    reference = asyncio.run(run_requests(prompts, {}))
+    pack_results = []
+    for pack_size in pack_sizes:
+        result = run_pack_benchmark(video_texts, pack_size, reference, pack_endpoint)
+        pack_results.append(result)
+        if pack_endpoint == "api":
+            print(f"{pack_size} videos per prompt: {result['videos_per_sec']} videos/sec, {result['agreement']:.2%} agreement with single prompts")
+        else:
+            print(f"{pack_size} videos per prompt: {result['videos_per_sec']} videos/sec, parser check {result['parser_check']:.2%}")
+    server.shutdown()
+
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    for rows, path in [(results, output_path), (pack_results, pack_output_path)]:
+        df_results = pd.DataFrame(rows)
+        print(df_results.to_string(index=False))
+        df_results.to_csv(path, index=False)
+        print(f"Benchmark results saved at: {path}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+import hashlib
+import os
+import sqlite3
+import time
+
+def make_cache_key(prompt, model_id, temperature, max_tokens):
+    """Creates the cache key from the model id, the temperature, the answer token limit and the full prompt."""
+    return hashlib.sha256(f"{model_id}\x00{temperature}\x00{max_tokens}\x00{prompt}".encode("utf-8")).hexdigest()
+
+def open_cache(path):
+    """Opens the LLM response cache (SQLite file) and creates the table if needed."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    conn = sqlite3.connect(path, timeout=60)
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS responses ("
+        "key TEXT PRIMARY KEY, model TEXT NOT NULL, answer TEXT NOT NULL, raw_response TEXT, created REAL NOT NULL)"
+    )
+    conn.commit()
+    return conn
+
+def lookup_responses(conn, keys, chunk_size=500):
+    """Returns a dict with the cached answer for each key found in the cache."""
+    found = {}
+    for i in range(0, len(keys), chunk_size):
+        chunk = keys[i:i+chunk_size]
+        placeholders = ",".join("?" * len(chunk))
+        for key, answer in conn.execute(f"SELECT key, answer FROM responses WHERE key IN ({placeholders})", chunk):
+            found[key] = answer
+    return found
+
+def store_response(conn, key, model_id, answer, raw_response):
+    """Stores one answer with the raw response, committed at once so paid answers survive a crash."""
+    conn.execute(
+        "INSERT OR REPLACE INTO responses (key, model, answer, raw_response, created) VALUES (?, ?, ?, ?, ?)",
+        (key, model_id, answer, raw_response, time.time())
+    )
+    conn.commit()
@@ -0,0 +1,178 @@
+import glob
+import hashlib
+import json
+import os
+import re
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+import config_analysis as config
+from topic_prompt import clean_field
+
+# short codes of the manually labelled videos (preprocess_labeled_data.py)
+TOPIC_CODES = {
+    "S&A": "Soziales & Arbeit",
+    "W&F": "Wirtschaft & Finanzen",
+    "S&O": "Sicherheit & Ordnung",
+    "M": "Migration",
+    "U&E": "Umwelt & Energie",
+    "I": "Internationale Politik",
+    "P": "Persönliches",
+    "W": "Wahlkampf"
+}
+EXAMPLE_PATTERN = re.compile(r"Beschreibung: (.*); Transkript: (.*); party:", re.DOTALL)
+
+def video_text(description, transcript):
+    """Returns description and transcript of a video as one text for the embedding model."""
+    return " ".join(text for text in (clean_field(description), clean_field(transcript)) if text)
+
+def map_topic(label):
+    """Maps a short code or topic name to the topic name, None for unknown labels (the first topic if there are two)."""
+    label = str(label).split(",")[0].strip()
+    label = TOPIC_CODES.get(label, label)
+    return label if label in TOPIC_CODES.values() else None
+
+def load_labeled_videos(labeled_dir):
+    """Loads text and topic of the manually labelled videos from the preprocessed CSV files."""
+    texts, labels = [], []
+    for path in sorted(glob.glob(os.path.join(labeled_dir, "*.csv"))):
+        df = pd.read_csv(path, engine="python", on_bad_lines="warn")
+        for _, row in df.iterrows():
+            topic = map_topic(row["Topic"])
+            text = video_text(row["video_description"], row["voice_to_text"])
+            if topic and text:
+                texts.append(text)
+                labels.append(topic)
+    return texts, labels
+
+def load_topic_examples(path):
+    """Loads text and topic of the fine-tuning examples (JSONL with system, user and assistant message)."""
+    texts, labels = [], []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                messages = {message["role"]: message["content"] for message in json.loads(line)["messages"]}
+            except (json.JSONDecodeError, KeyError):
+                continue
+            match = EXAMPLE_PATTERN.search(messages.get("user", ""))
+            topic = map_topic(messages.get("assistant", ""))
+            if match and topic:
+                text = video_text(match.group(1), match.group(2))
+                if text:
+                    texts.append(text)
+                    labels.append(topic)
+    return texts, labels
+
+def load_training_examples():
+    """Loads the labelled videos, or the fine-tuning examples if the labelled videos are not available."""
+    texts, labels = load_labeled_videos(config.topic_labeled_dir)
+    if not texts and os.path.exists(config.topic_examples_path):
+        texts, labels = load_topic_examples(config.topic_examples_path)
+    return texts, labels
+
+def load_embedding_model():
+    """Loads the sentence embedding model on the CPU."""
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(config.topic_embedding_model, device="cpu")
+
+def embed_texts(model, texts):
+    """Returns the normalised embeddings of the texts as matrix with one row per text."""
+    return model.encode(texts, batch_size=config.topic_embedding_batch_size, normalize_embeddings=True,
+                        convert_to_numpy=True, show_progress_bar=False)
+
+def build_centroids(embeddings, labels):
+    """Returns the topics and the normalised mean embedding of each topic."""
+    labels = np.asarray(labels)
+    topics = sorted(set(labels))
+    centroids = np.vstack([embeddings[labels == topic].mean(axis=0) for topic in topics])
+    return topics, centroids / np.linalg.norm(centroids, axis=1, keepdims=True)
+
+def training_data_hash(texts, labels):
+    """Returns a hash of the labelled texts and topics to detect changes of the training data."""
+    data = "\n".join(f"{label}\t{text}" for text, label in zip(texts, labels))
+    return hashlib.sha1(data.encode("utf-8")).hexdigest()
+
+@lru_cache(maxsize=1)
+def labeled_data_hash():
+    """Returns the hash of the training examples of the local classifier, read once per run."""
+    return training_data_hash(*load_training_examples())
+
+def load_centroids(path, model_name, data_hash):
+    """Loads the topics and centroids saved for the embedding model and training data, None if there are none."""
+    if not path or not os.path.exists(path):
+        return None
+    with np.load(path) as data:
+        if str(data["model"]) != model_name or str(data["data_hash"]) != data_hash:
+            return None
+        return data["topics"].tolist(), data["centroids"]
+
+def save_centroids(path, model_name, data_hash, topics, centroids):
+    """Saves the topics and centroids with the name of the embedding model and the hash of the training data."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    np.savez(path, model=model_name, data_hash=data_hash, topics=np.array(topics), centroids=centroids)
+
+def get_centroids(model=None):
+    """Returns the embedding model (None if not loaded yet), topics and centroids of the labelled videos, the centroids
+    are embedded again only if the embedding model or the training data changed."""
+    texts, labels = load_training_examples()
+    if len(set(labels)) < 2:
+        return model, [], None
+    data_hash = training_data_hash(texts, labels)
+    saved = load_centroids(config.topic_centroids_path, config.topic_embedding_model, data_hash)
+    if saved is not None:
+        print(f"Local classifier: centroids of {len(saved[0])} topics loaded from {config.topic_centroids_path}")
+        return model, saved[0], saved[1]
+    model = model or load_embedding_model()
+    topics, centroids = build_centroids(embed_texts(model, texts), labels)
+    print(f"Local classifier: {len(texts)} labelled videos, {len(topics)} topics")
+    if config.topic_centroids_path:
+        save_centroids(config.topic_centroids_path, config.topic_embedding_model, data_hash, topics, centroids)
+    return model, topics, centroids
+
+def score_embeddings(embeddings, centroids):
+    """Returns the index of the nearest centroid, its cosine similarity and the margin to the second nearest one."""
+    similarities = embeddings @ centroids.T
+    order = np.argsort(similarities, axis=1)
+    rows = np.arange(len(similarities))
+    best = similarities[rows, order[:, -1]]
+    margin = best - similarities[rows, order[:, -2]]
+    return order[:, -1], best, margin
+
+def pre_classify_videos(video_texts, model=None):
+    """Assigns the topic of the nearest centroid to the videos with a margin of at least topic_local_margin.
+
+    Returns dict video index -> (topic, similarity, margin), videos with a lower margin are left for the LLM.
+    """
+    model, topics, centroids = get_centroids(model)
+    if centroids is None:
+        raise ValueError(f"No labelled videos with at least two topics in {config.topic_labeled_dir} or {config.topic_examples_path} "
+                         f"for the local classifier, set topic_local_classifier = False to send all videos to the LLM.")
+
+    # videos without description and transcript are left for the LLM
+    indices = [i for i, (description, transcript, _) in enumerate(video_texts) if description or transcript]
+    if not indices:
+        return {}
+    model = model or load_embedding_model()
+    embeddings = embed_texts(model, [video_text(video_texts[i][0], video_texts[i][1]) for i in indices])
+    nearest, similarity, margin = score_embeddings(embeddings, centroids)
+    return {
+        i: (topics[nearest[j]], float(similarity[j]), float(margin[j]))
+        for j, i in enumerate(indices) if margin[j] >= config.topic_local_margin
+    }
+
+def report_local_agreement(audited, path):
+    """Prints the agreement of the local topics with the LLM answers by margin and saves the compared videos.
+
+    audited is a list of dicts with id, local_topic, gpt_topic, similarity and margin of each checked video.
+    """
+    df = pd.DataFrame([entry for entry in audited if entry["gpt_topic"] != "ERROR"])
+    if df.empty:
+        return df
+    # the LLM may answer with two topics
+    df["agree"] = [local in str(answer) for local, answer in zip(df["local_topic"], df["gpt_topic"])]
+    print(f"Agreement of local topics with the LLM: {df['agree'].mean():.2%} of {len(df)} checked videos")
+    margin_quartiles = pd.qcut(df["margin"], q=4, duplicates="drop")
+    print(df.groupby(margin_quartiles, observed=True)["agree"].agg(["mean", "count"]).to_string())
+    df.to_csv(path, index=False)
+    print(f"Local topics compared with the LLM saved at: {path}")
+    return df
@@ -0,0 +1,98 @@
+import math
+import re
+import numpy as np
+import pandas as pd
+import config_analysis as config
+
+HASHTAG_PATTERN = re.compile(r"#\w+")
+SENTENCE_PATTERN = re.compile(r"(?<=[.!?])\s+")
+EMPTY_VALUES = {"", "nan", "none", "[]"}
+
+# tiktoken encoding, loaded on first use (False if it is not available)
+tokenizer = None
+
+def load_tokenizer():
+    """Returns the tiktoken encoding of the model, None if tiktoken or the encoding file is not available."""
+    global tokenizer
+    if tokenizer is None:
+        try:
+            import tiktoken
+            tokenizer = tiktoken.get_encoding(config.topic_tokenizer_encoding)
+        except Exception as e:
+            print(f"Tokenizer {config.topic_tokenizer_encoding} not available ({e}), token counts are estimated from the text length.")
+            tokenizer = False
+    return tokenizer or None
+
+def count_tokens(text):
+    """Counts the tokens of a text with the model tokenizer (about 4 characters per token without tokenizer)."""
+    encoding = load_tokenizer()
+    if encoding is None:
+        return math.ceil(len(text) / 4)
+    return len(encoding.encode(text, disallowed_special=()))
+
+def truncate_tokens(text, max_tokens):
+    """Keeps the beginning of the text up to max_tokens tokens."""
+    if max_tokens <= 0:
+        return ""
+    encoding = load_tokenizer()
+    if encoding is None:
+        return text[:max_tokens * 4]
+    tokens = encoding.encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text
+    # a token cut in the middle of a character is decoded as replacement character
+    return encoding.decode(tokens[:max_tokens]).rstrip("�").rstrip()
+
+def clean_field(value):
+    """Returns the text of a description or transcript with normalised whitespace, "" if it is missing."""
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return ""
+    text = " ".join(str(value).split())
+    return "" if text.lower() in EMPTY_VALUES else text
+
+def dedupe_hashtags(text):
+    """Removes repeated hashtags (case-insensitive), the first occurrence is kept."""
+    seen = set()
+    def keep_first(match):
+        tag = match.group(0).lower()
+        if tag in seen:
+            return ""
+        seen.add(tag)
+        return match.group(0)
+    return " ".join(HASHTAG_PATTERN.sub(keep_first, text).split())
+
+def dedupe_sentences(text):
+    """Removes repeated sentences, which are frequent in automatic transcripts."""
+    seen = set()
+    sentences = []
+    for sentence in SENTENCE_PATTERN.split(text):
+        key = sentence.lower()
+        if key not in seen:
+            seen.add(key)
+            sentences.append(sentence)
+    return " ".join(sentences)
+
+def compress_video_text(description, transcript, budget=None):
+    """Cleans description and transcript and shortens them to the token budget, the description gets at most half of it."""
+    description = dedupe_hashtags(clean_field(description))
+    transcript = dedupe_sentences(clean_field(transcript))
+    if budget is None:
+        return description, transcript
+    description = truncate_tokens(description, budget // 2 if transcript else budget)
+    transcript = truncate_tokens(transcript, budget - count_tokens(description))
+    return description, transcript
+
+def estimate_cost(prompt_tokens, answer_tokens):
+    """Estimated cost in USD of the prompt tokens and the answer tokens."""
+    cost = (prompt_tokens * config.topic_price_input + answer_tokens * config.topic_price_output) / 1e6
+    # the Batch API costs half
+    return cost / 2 if config.topic_mode == "batch" else cost
+
+def report_prompt_tokens(runs):
+    """Prints the token distribution and the estimated cost of each run, runs is a list of (name, prompts, max answer tokens)."""
+    for name, prompts, max_tokens in runs:
+        counts = np.array([count_tokens(prompt) for prompt in prompts]) if prompts else np.zeros(1, dtype=int)
+        p50, p90, p99 = np.percentile(counts, [50, 90, 99])
+        print(f"Prompt tokens {name}: {len(prompts)} prompts, {counts.sum()} total, mean {counts.mean():.0f}, "
+              f"p50 {p50:.0f}, p90 {p90:.0f}, p99 {p99:.0f}, max {counts.max()}, "
+              f"estimated cost {estimate_cost(counts.sum(), len(prompts) * max_tokens):.2f} USD")
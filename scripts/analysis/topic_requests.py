@@ -0,0 +1,200 @@
+import asyncio
+import os
+import random
+import time
+import openai
+import config_analysis as config
+from topic_cache import lookup_responses, make_cache_key, open_cache, store_response
+from topic_prompt import count_tokens
+
+# errors after which the same request is sent again
+RETRY_ERRORS = (openai.RateLimitError, openai.APIConnectionError, openai.APITimeoutError, openai.InternalServerError)
+
+class RateLimiter:
+    """Token buckets for requests per minute and tokens per minute, shared by all concurrent requests."""
+
+    def __init__(self, requests_per_minute=None, tokens_per_minute=None):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        # start with a full minute of budget, like the limits of the API
+        self.requests = requests_per_minute or 0
+        self.tokens = tokens_per_minute or 0
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    def refill(self):
+        now = time.monotonic()
+        elapsed = now - self.updated
+        self.updated = now
+        if self.requests_per_minute:
+            self.requests = min(self.requests_per_minute, self.requests + elapsed * self.requests_per_minute / 60)
+        if self.tokens_per_minute:
+            self.tokens = min(self.tokens_per_minute, self.tokens + elapsed * self.tokens_per_minute / 60)
+
+    async def acquire(self, tokens):
+        """Waits until one request with the given number of tokens fits into both limits, waiting requests are served in order."""
+        async with self.lock:
+            if self.tokens_per_minute:
+                tokens = min(tokens, self.tokens_per_minute)
+            while True:
+                self.refill()
+                request_wait = (1 - self.requests) * 60 / self.requests_per_minute if self.requests_per_minute else 0
+                token_wait = (tokens - self.tokens) * 60 / self.tokens_per_minute if self.tokens_per_minute else 0
+                if request_wait <= 0 and token_wait <= 0:
+                    if self.requests_per_minute:
+                        self.requests -= 1
+                    if self.tokens_per_minute:
+                        self.tokens -= tokens
+                    return
+                await asyncio.sleep(max(request_wait, token_wait))
+
+def get_api_key():
+    """Returns the OpenAI API key from the environment (.env)."""
+    api_key = os.getenv("OPENAI_API_KEY")
+    if api_key is None and config.topic_api_base_url:
+        # the local stand-in does not check the key
+        api_key = "local"
+    return api_key
+
+def make_client():
+    """Creates the async OpenAI client, the retries are handled by request_completion."""
+    return openai.AsyncOpenAI(api_key=get_api_key(), base_url=config.topic_api_base_url, max_retries=0, timeout=config.topic_timeout)
+
+def estimate_tokens(prompt, max_tokens):
+    """Number of prompt tokens and maximum answer tokens of a request for the tokens-per-minute limit."""
+    return count_tokens(prompt) + max_tokens
+
+def answer_text(response):
+    """Returns the answer of the model from a completion response."""
+    return response.choices[0].text
+
+def retry_delay(error, attempt):
+    """Returns the wait before the next attempt: the retry-after header if given, else exponential backoff with jitter."""
+    response = getattr(error, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    if retry_after:
+        try:
+            return float(retry_after)
+        except ValueError:
+            pass
+    return min(60, 2 ** attempt) * random.uniform(0.5, 1.0)
+
+async def request_completion(client, prompt, limiter, semaphore, stats, max_tokens):
+    """Sends one completion request within the concurrency and rate limits, returns the response or None after errors."""
+    async with semaphore:
+        for attempt in range(config.topic_max_retries + 1):
+            await limiter.acquire(estimate_tokens(prompt, max_tokens))
+            try:
+                response = await client.completions.create(
+                    model=config.topic_model_name,
+                    prompt=prompt,
+                    max_tokens=max_tokens,
+                    temperature=config.topic_temperature
+                )
+                stats["requests"] = stats.get("requests", 0) + 1
+                if response.usage is not None:
+                    stats["prompt_tokens"] = stats.get("prompt_tokens", 0) + response.usage.prompt_tokens
+                    stats["completion_tokens"] = stats.get("completion_tokens", 0) + response.usage.completion_tokens
+                return response
+            except RETRY_ERRORS as e:
+                stats["retries"] = stats.get("retries", 0) + 1
+                if attempt == config.topic_max_retries:
+                    print(f"Error for query after {attempt + 1} attempts: {e}")
+                    break
+                await asyncio.sleep(retry_delay(e, attempt))
+            except openai.OpenAIError as e:
+                print(f"Error for query: {e}")
+                break
+        stats["errors"] = stats.get("errors", 0) + 1
+        return None
+
+def prepare_prompts(prompts, stats, max_tokens):
+    """Looks up the prompts in the response cache and returns the cache key of every prompt, the positions of every key,
+    the cached answers, the prompts that still need a request (one per key) and the cache connection."""
+    # the answer token limit can cut off an answer, so it is part of the key
+    keys = [make_cache_key(prompt, config.topic_model_name, config.topic_temperature, max_tokens) for prompt in prompts]
+    positions = {}
+    for i, key in enumerate(keys):
+        positions.setdefault(key, []).append(i)
+    conn = open_cache(config.topic_cache_path) if config.topic_cache_path else None
+    answers = lookup_responses(conn, list(positions)) if conn else {}
+    pending = {}
+    for key, prompt in zip(keys, prompts):
+        if key not in answers:
+            pending.setdefault(key, prompt)
+    stats["duplicates"] = stats.get("duplicates", 0) + sum(key not in answers for key in keys) - len(pending)
+    # hits and misses only with a cache
+    if conn:
+        stats["cache_hits"] = stats.get("cache_hits", 0) + sum(key in answers for key in keys)
+        stats["cache_misses"] = stats.get("cache_misses", 0) + len(pending)
+    return keys, positions, answers, pending, conn
+
+def save_answer(conn, answers, key, response):
+    """Keeps the answer of a response and stores it with the raw response in the cache."""
+    answers[key] = answer_text(response)
+    if conn:
+        store_response(conn, key, config.topic_model_name, answers[key], response.model_dump_json())
+
+def report_answer(on_answer, positions, answers, key):
+    """Calls on_answer for every prompt with the given key."""
+    if on_answer:
+        for i in positions[key]:
+            on_answer(i, answers[key])
+
+async def run_requests(prompts, stats, client=None, on_answer=None, max_tokens=None):
+    """Sends all prompts concurrently and returns the answers in the order of the prompts.
+
+    Prompts answered before (response cache) or repeated within the run are not sent again.
+    on_answer(index, answer) is called for every prompt as soon as its answer is known.
+    """
+    max_tokens = max_tokens or config.topic_max_tokens
+    keys, positions, answers, pending, conn = prepare_prompts(prompts, stats, max_tokens)
+    for key in positions:
+        if key in answers:
+            report_answer(on_answer, positions, answers, key)
+
+    # a client passed in belongs to the caller and stays open
+    own_client = client is None
+    client = client or make_client()
+    limiter = RateLimiter(config.topic_requests_per_minute, config.topic_tokens_per_minute)
+    semaphore = asyncio.Semaphore(config.topic_concurrency)
+    start = time.perf_counter()
+    done = 0
+
+    async def request_with_progress(key, prompt):
+        nonlocal done
+        response = await request_completion(client, prompt, limiter, semaphore, stats, max_tokens)
+        if response is not None:
+            save_answer(conn, answers, key, response)
+            report_answer(on_answer, positions, answers, key)
+        done += 1
+        if done % 100 == 0:
+            print(f"Classified {done} of {len(pending)} prompts...")
+
+    try:
+        await asyncio.gather(*(request_with_progress(key, prompt) for key, prompt in pending.items()))
+    finally:
+        if own_client:
+            await client.close()
+        if conn:
+            conn.close()
+    stats["duration"] = stats.get("duration", 0) + time.perf_counter() - start
+    return [answers.get(key, "ERROR") for key in keys]
+
+def print_request_stats(stats):
+    """Prints number of requests, retries, errors, tokens and throughput."""
+    duration = stats.get("duration", 0)
+    requests = stats.get("requests", 0)
+    hits = stats.get("cache_hits", 0)
+    misses = stats.get("cache_misses", 0)
+    if hits + misses > 0:
+        print(f"Response cache: {hits} hits, {misses} misses ({hits / (hits + misses):.2%} hit rate), "
+              f"{stats.get('duplicates', 0)} duplicate prompts within the run")
+    elif stats.get("duplicates", 0) > 0:
+        print(f"{stats['duplicates']} duplicate prompts within the run")
+    print(f"Requests: {requests}, retries: {stats.get('retries', 0)}, errors: {stats.get('errors', 0)}")
+    if "requeued" in stats:
+        print(f"Videos sent again one by one after a failed or partial pack: {stats['requeued']}")
+    print(f"Tokens: {stats.get('prompt_tokens', 0)} prompt, {stats.get('completion_tokens', 0)} completion")
+    if duration > 0:
+        print(f"Sent {requests} requests in {duration:.1f} s ({requests / duration:.1f} requests/sec)")
@@ -0,0 +1,243 @@
+import hashlib
+import json
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+from email.parser import BytesParser
+from email.policy import default as default_policy
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# same topics as in the prompt of topic_analysis.py
+TOPICS = [
+    "Soziales & Arbeit", "Wirtschaft & Finanzen", "Sicherheit & Ordnung", "Migration",
+    "Umwelt & Energie", "Internationale Politik", "Persönliches", "Wahlkampf"
+]
+
+def standin_topic(text):
+    """Returns a fixed topic for a video text, so repeated requests for the same video get the same answer."""
+    digest = hashlib.sha1(text.encode("utf-8")).digest()
+    return TOPICS[digest[0] % len(TOPICS)]
+
+def answer_fields(text):
+    """Returns the topic of a video from its description and transcript lines (party line for videos without texts)."""
+    fields = re.findall(r"^(?:Beschreibung|Transkript): (.*)$", text, re.MULTILINE)
+    fields = fields or re.findall(r"^Partei: (.*)$", text, re.MULTILINE)
+    return standin_topic("\n".join(fields) if fields else text)
+
+def answer_prompt(prompt, answer_error_rate=0.0):
+    """Answers a classification prompt with the topic of its description and transcript.
+
+    Packed prompts ("Video 1:", "Video 2:", ...) get a JSON object with the topic of each video,
+    entries are left out with probability answer_error_rate.
+    """
+    blocks = re.split(r"^Video (\d+):$", prompt, flags=re.MULTILINE)
+    if len(blocks) == 1:
+        return answer_fields(prompt)
+    topics = {}
+    for number, block in zip(blocks[1::2], blocks[2::2]):
+        if random.random() >= answer_error_rate:
+            topics[number] = answer_fields(block)
+    return json.dumps(topics, ensure_ascii=False)
+
+def complete_prompt(body, request_id, answer_error_rate=0.0):
+    """Returns the completion response for a request body, the answer is cut off at max_tokens."""
+    prompt = body.get("prompt", "")
+    text = answer_prompt(prompt, answer_error_rate)
+    max_tokens = body.get("max_tokens") or 16
+    finish_reason = "length" if len(text) > max_tokens * 4 else "stop"
+    text = text[:max_tokens * 4]
+    prompt_tokens = len(prompt) // 4 + 1
+    completion_tokens = len(text) // 4 + 1
+    return {
+        "id": f"cmpl-{request_id}",
+        "object": "text_completion",
+        "created": int(time.time()),
+        "model": body.get("model"),
+        "choices": [{"text": text, "index": 0, "logprobs": None, "finish_reason": finish_reason}],
+        "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens}
+    }
+
+def process_batch(server, batch):
+    """Answers all requests of a batch file after the batch delay and writes the output file, like the Batch API."""
+    time.sleep(server.batch_delay)
+    batch["status"] = "in_progress"
+    with open(server.file_path(batch["input_file_id"]), encoding="utf-8") as f:
+        requests = [json.loads(line) for line in f if line.strip()]
+    batch["request_counts"]["total"] = len(requests)
+    lines = []
+    for request in requests:
+        if random.random() < server.error_rate:
+            response = {"status_code": 500, "request_id": "", "body": {"error": {"message": "Server error", "type": "server_error"}}}
+            batch["request_counts"]["failed"] += 1
+        else:
+            response = {"status_code": 200, "request_id": "", "body": complete_prompt(request["body"], server.request_count(), server.answer_error_rate)}
+            batch["request_counts"]["completed"] += 1
+        lines.append(json.dumps({"id": f"batch_req_{server.request_count()}", "custom_id": request["custom_id"], "response": response, "error": None}))
+    output = server.save_file(("\n".join(lines) + "\n").encode("utf-8"), "batch_output.jsonl", "batch_output")
+    batch["output_file_id"] = output["id"]
+    batch["status"] = "completed"
+    batch["completed_at"] = int(time.time())
+
+class StandinHandler(BaseHTTPRequestHandler):
+    """OpenAI-compatible /v1/completions endpoint with a latency per request and per answer token, random 429 errors
+    and a requests-per-minute limit.
+
+    /v1/files and /v1/batches keep the uploaded and answered batch files in a local folder.
+    """
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, body, headers=None):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def rate_limited(self):
+        """Sliding one-minute window of the accepted requests, like the limits of the real API."""
+        server = self.server
+        if server.requests_per_minute is None:
+            return False
+        with server.lock:
+            now = time.monotonic()
+            while server.accepted and server.accepted[0] < now - 60:
+                server.accepted.pop(0)
+            if len(server.accepted) >= server.requests_per_minute:
+                return True
+            server.accepted.append(now)
+            return False
+
+    def read_body(self):
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    def upload_file(self):
+        """Saves the file of a multipart upload (client.files.create)."""
+        header = f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode("utf-8")
+        message = BytesParser(policy=default_policy).parsebytes(header + self.read_body())
+        fields = {part.get_param("name", header="content-disposition"): part for part in message.iter_parts()}
+        upload = fields["file"]
+        purpose = fields["purpose"].get_payload(decode=True).decode("utf-8")
+        self.send_json(200, self.server.save_file(upload.get_payload(decode=True), upload.get_filename(), purpose))
+
+    def create_batch(self):
+        body = json.loads(self.read_body())
+        server = self.server
+        batch = {
+            "id": f"batch_{server.request_count()}",
+            "object": "batch",
+            "endpoint": body["endpoint"],
+            "input_file_id": body["input_file_id"],
+            "completion_window": body["completion_window"],
+            "status": "validating",
+            "created_at": int(time.time()),
+            "output_file_id": None,
+            "request_counts": {"total": 0, "completed": 0, "failed": 0}
+        }
+        server.batches[batch["id"]] = batch
+        threading.Thread(target=process_batch, args=(server, batch), daemon=True).start()
+        self.send_json(200, batch)
+
+    def do_GET(self):
+        parts = self.path.rstrip("/").split("/")
+        if "batches" in parts and parts[-1] in self.server.batches:
+            self.send_json(200, self.server.batches[parts[-1]])
+        elif parts[-1] == "content" and os.path.exists(self.server.file_path(parts[-2])):
+            with open(self.server.file_path(parts[-2]), "rb") as f:
+                data = f.read()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        else:
+            self.send_json(404, {"error": {"message": f"Unknown path {self.path}", "type": "invalid_request_error"}})
+
+    def do_POST(self):
+        if self.path.endswith("/files"):
+            self.upload_file()
+            return
+        if self.path.endswith("/batches"):
+            self.create_batch()
+            return
+        body = json.loads(self.read_body() or b"{}")
+        if not self.path.endswith("/completions"):
+            self.send_json(404, {"error": {"message": f"Unknown path {self.path}", "type": "invalid_request_error"}})
+            return
+        if self.rate_limited() or random.random() < self.server.error_rate:
+            self.send_json(429, {"error": {"message": "Rate limit reached", "type": "requests"}}, {"retry-after": "1"})
+            return
+        response = complete_prompt(body, self.server.request_count(), self.server.answer_error_rate)
+        # longer answers take longer, like the token generation of the model
+        time.sleep(self.server.latency + self.server.token_latency * response["usage"]["completion_tokens"])
+        self.send_json(200, response)
+
+class StandinServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency=0.2, error_rate=0.0, requests_per_minute=None, batch_delay=1.0, file_dir=None,
+                 token_latency=0.0, answer_error_rate=0.0):
+        super().__init__(address, StandinHandler)
+        self.latency = latency
+        self.token_latency = token_latency
+        self.error_rate = error_rate
+        self.answer_error_rate = answer_error_rate
+        self.requests_per_minute = requests_per_minute
+        self.batch_delay = batch_delay
+        self.file_dir = file_dir or tempfile.mkdtemp(prefix="topic_standin_")
+        os.makedirs(self.file_dir, exist_ok=True)
+        self.batches = {}
+        self.accepted = []
+        self.lock = threading.Lock()
+        self.count = 0
+
+    def request_count(self):
+        with self.lock:
+            self.count += 1
+            return self.count
+
+    def file_path(self, file_id):
+        return os.path.join(self.file_dir, os.path.basename(file_id))
+
+    def save_file(self, data, filename, purpose):
+        """Saves a file in the file folder and returns its file object."""
+        file_id = f"file-{self.request_count()}"
+        with open(self.file_path(file_id), "wb") as f:
+            f.write(data)
+        return {"id": file_id, "object": "file", "bytes": len(data), "created_at": int(time.time()),
+                "filename": filename, "purpose": purpose, "status": "processed"}
+
+def start_standin_server(port=0, latency=0.2, error_rate=0.0, requests_per_minute=None, batch_delay=1.0, file_dir=None,
+                         token_latency=0.0, answer_error_rate=0.0):
+    """Starts the stand-in server in a background thread and returns it, the base URL is http://127.0.0.1:{port}/v1."""
+    server = StandinServer(("127.0.0.1", port), latency, error_rate, requests_per_minute, batch_delay, file_dir,
+                           token_latency, answer_error_rate)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def main():
+    # configurations
+    port = 8000
+    latency = 0.3 # seconds per request
+    token_latency = 0.01 # seconds per answer token
+    error_rate = 0.02 # share of requests answered with 429
+    answer_error_rate = 0.01 # share of videos left out of the JSON answer of a packed prompt
+    requests_per_minute = None
+    batch_delay = 5.0 # seconds until a batch is answered
+    file_dir = "results/topic_analysis/standin_files" # uploaded batch files and batch results
+
+    server = StandinServer(("127.0.0.1", port), latency, error_rate, requests_per_minute, batch_delay, file_dir,
+                           token_latency, answer_error_rate)
+    print(f"Stand-in server for topic classification running at http://127.0.0.1:{port}/v1")
+    server.serve_forever()
+
+if __name__ == "__main__":
+    main()
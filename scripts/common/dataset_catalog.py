@@ -0,0 +1,65 @@
+import os
+import re
+
+# folder and file name pattern of each stage, the period is start date and end date (e.g. 20250101_20250223)
+STAGES = {
+    "raw_comments": ("data/data_raw/comments", r"(?P<account>.+)_comments_(?P<period>\d{8}_\d{8})_complete\.csv"),
+    "raw_videos": ("data/data_raw/videos", r"(?P<account>.+)_video_data_(?P<period>\d{8}_\d{8})_complete\.csv"),
+    "comments": ("data/data_preprocessed/comments", r"(?P<account>.+)_comments_(?P<period>\d{8}_\d{8})_preprocessed\.csv"),
+    "videos": ("data/data_preprocessed/videos", r"(?P<account>.+)_video_data_(?P<period>\d{8}_\d{8})_preprocessed\.csv"),
+    "sentiment": (
+        "results/sentiment_analysis",
+        r"(?P<period>\d{8}_\d{8})/(?P<account>.+)_comments_with_sentiment_complete\.csv"
+    ),
+    "emoji_sentiment": (
+        "results/sentiment_analysis",
+        r"(?P<period>\d{8}_\d{8})_with_emoji_sentiment/(?P<account>.+)_comments_with_sentiment_final\.csv"
+    ),
+}
+
+catalog = None
+
+def make_period(start_date, end_date):
+    """Returns the period key used in the file names."""
+    return f"{start_date}_{end_date}"
+
+def scan_folder(folder):
+    """Returns the files in the folder and its direct subfolders as relative paths with "/"."""
+    files = []
+    if not os.path.isdir(folder):
+        return files
+    for entry in os.scandir(folder):
+        if entry.is_file():
+            files.append(entry.name)
+        elif entry.is_dir():
+            files.extend(f"{entry.name}/{sub.name}" for sub in os.scandir(entry.path) if sub.is_file())
+    return files
+
+def build_catalog():
+    """Scans every stage folder once and returns a dict (account, period, stage) -> exact file path."""
+    entries = {}
+    listings = {}
+    for stage, (folder, pattern) in STAGES.items():
+        if folder not in listings:
+            listings[folder] = scan_folder(folder)
+        regex = re.compile(pattern)
+        for name in listings[folder]:
+            match = regex.fullmatch(name)
+            if match:
+                entries[(match["account"], match["period"], stage)] = os.path.join(folder, *name.split("/"))
+    return entries
+
+def get_catalog(refresh=False):
+    """Returns the catalog of this run, refresh after a stage wrote files that are read later in the same run."""
+    global catalog
+    if catalog is None or refresh:
+        catalog = build_catalog()
+    return catalog
+
+def find_file(account, period, stage):
+    """Returns the path of the file of an account in a period and stage, None if it does not exist."""
+    return get_catalog().get((account, period, stage))
+
+def list_accounts(period, stage):
+    """Returns the accounts with a file in the period and stage."""
+    return sorted(account for account, file_period, file_stage in get_catalog() if file_period == period and file_stage == stage)
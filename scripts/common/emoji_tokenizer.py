@@ -0,0 +1,102 @@
+import re
+import numpy as np
+import pandas as pd
+import emoji
+
+# zero width joiners or tag characters outside of a matched emoji are passed to the emoji package,
+# so its handling of ZWJ sequences that are not in the emoji data stays exactly the same
+FALLBACK_CHARS = re.compile("[\u200d\U000e0020-\U000e007f]")
+
+def build_trie(sequences):
+    """Builds a character trie of the emoji sequences, "" marks the end of an emoji."""
+    trie = {}
+    for sequence in sequences:
+        node = trie
+        for char in sequence:
+            node = node.setdefault(char, {})
+        node[""] = True
+    return trie
+
+def trie_to_regex(node):
+    """Converts a trie node into a regex that prefers the longest emoji, like the search tree of the emoji package."""
+    leaves = sorted(char for char, child in node.items() if char and list(child) == [""])
+    branches = sorted(char for char, child in node.items() if char and list(child) != [""])
+    alternatives = [re.escape(char) + trie_to_regex(node[char]) for char in branches]
+    if leaves:
+        alternatives.append(char_class(leaves))
+    if not alternatives:
+        return ""
+    pattern = "(?:" + "|".join(alternatives) + ")"
+    return pattern + "?" if "" in node else pattern
+
+def char_class(chars, gap=1):
+    """Returns a regex character class with code points at most gap apart merged into ranges, which is much faster to search."""
+    ranges = []
+    for code in sorted(ord(char) for char in chars):
+        if ranges and code - ranges[-1][1] <= gap:
+            ranges[-1][1] = code
+        else:
+            ranges.append([code, code])
+    parts = [re.escape(chr(first)) if first == last else f"{re.escape(chr(first))}-{re.escape(chr(last))}" for first, last in ranges]
+    return "[" + "".join(parts) + "]"
+
+def build_emoji_pattern():
+    """Compiles one regex for whole emojis: a coarse class of the first characters, then the rest of the emoji
+    for the exact first characters (lookbehind), first characters with the same rest share one alternative."""
+    trie = build_trie(emoji.EMOJI_DATA)
+    groups = {}
+    for char, node in trie.items():
+        groups.setdefault(trie_to_regex(node), []).append(char)
+    tails = ["(?<=" + char_class(chars) + ")" + tail for tail, chars in sorted(groups.items(), key=lambda group: min(group[1]))]
+    return re.compile(char_class(trie, gap=64) + "(?:" + "|".join(tails) + ")")
+
+EMOJI_PATTERN = build_emoji_pattern()
+
+def emoji_spans(text):
+    """Returns start and end of every emoji in the text (longest match at each position), None if the text needs the emoji package."""
+    spans = [match.span() for match in EMOJI_PATTERN.finditer(text)]
+
+    # check the text between the emojis for joiners of unknown sequences
+    pos = 0
+    for start, end in spans + [(len(text), len(text))]:
+        if FALLBACK_CHARS.search(text, pos, start):
+            return None
+        pos = end
+    return spans
+
+def find_emojis(text):
+    """Returns the emojis in the text, same as [e['emoji'] for e in emoji.emoji_list(text)]."""
+    text = str(text)
+    spans = emoji_spans(text)
+    if spans is None:
+        return [e['emoji'] for e in emoji.emoji_list(text)]
+    return [text[start:end] for start, end in spans]
+
+def find_emojis_column(texts):
+    """Returns the list of emojis for every text of a column, texts with joiners or tags outside of emojis go through the emoji package."""
+    texts = pd.Series(texts, dtype=object).astype(str)
+    emojis = texts.str.findall(EMOJI_PATTERN)
+    # only texts with joiners or tags need the check between the emojis
+    for i in np.flatnonzero(texts.str.contains(FALLBACK_CHARS).to_numpy()):
+        if emoji_spans(texts.iat[i]) is None:
+            emojis.iat[i] = [e['emoji'] for e in emoji.emoji_list(texts.iat[i])]
+    return emojis.tolist()
+
+def remove_variation_selectors(text):
+    """Removes variation selectors outside of emojis, like emoji.replace_emoji."""
+    return text.replace("\ufe0e", "").replace("\ufe0f", "")
+
+def replace_emojis(text, replace=""):
+    """Replaces the emojis in the text, same as emoji.replace_emoji(text, replace=replace)."""
+    text = str(text)
+    spans = emoji_spans(text)
+    if spans is None:
+        return emoji.replace_emoji(text, replace=replace)
+    parts = []
+    pos = 0
+    for start, end in spans:
+        parts.append(remove_variation_selectors(text[pos:start]))
+        parts.append(replace)
+        pos = end
+    parts.append(remove_variation_selectors(text[pos:]))
+    return "".join(parts)
@@ -0,0 +1,162 @@
+import hashlib
+import heapq
+import numpy as np
+import pandas as pd
+
+class FrequencySketch:
+    """Approximate counter with bounded memory: SpaceSaving counters for the top items and a Count-Min sketch.
+
+    Every reported count is an upper bound of the true count. The SpaceSaving error of an item is at most
+    total / capacity, the Count-Min error at most e / width * total with probability 1 - e^-depth.
+    Sketches with the same capacity, width and depth can be merged, e.g. across accounts and periods.
+    """
+
+    def __init__(self, capacity=1000, width=2 ** 14, depth=4):
+        self.capacity = capacity
+        self.width = width
+        self.depth = depth
+        self.total = 0
+        self.counts = {}
+        self.errors = {}
+        # min-heap of (count, item), entries of changed or removed counters are skipped when popping
+        self.heap = []
+        self.table = np.zeros((depth, width), dtype=np.int64)
+
+    def update(self, items):
+        """Adds items like Counter.update: an iterable counts every item once, a mapping adds the given counts."""
+        pairs = items.items() if hasattr(items, "items") else ((item, 1) for item in items)
+        weights = {}
+        for item, count in pairs:
+            if count > 0:
+                item = str(item)
+                weights[item] = weights.get(item, 0) + count
+        if not weights:
+            return
+        rows, columns = self.hash_columns(list(weights))
+        np.add.at(self.table, (rows, columns), np.repeat(np.fromiter(weights.values(), dtype=np.int64), self.depth))
+        for item, count in weights.items():
+            self.add_counter(item, count)
+        self.total += sum(weights.values())
+
+    def hash_columns(self, items):
+        """Returns the row and column of every item in the Count-Min table, stable across processes and runs."""
+        columns = []
+        for item in items:
+            digest = hashlib.blake2b(item.encode("utf-8"), digest_size=16).digest()
+            first = int.from_bytes(digest[:8], "little")
+            step = int.from_bytes(digest[8:], "little") | 1
+            columns.extend((first + row * step) % self.width for row in range(self.depth))
+        rows = np.tile(np.arange(self.depth), len(items))
+        return rows, np.array(columns, dtype=np.int64)
+
+    def add_counter(self, item, count):
+        """SpaceSaving update, a new item replaces the smallest counter if all counters are in use."""
+        if item in self.counts:
+            self.counts[item] += count
+        elif len(self.counts) < self.capacity:
+            self.counts[item] = count
+            self.errors[item] = 0
+        else:
+            minimum, victim = self.pop_min()
+            del self.counts[victim], self.errors[victim]
+            self.counts[item] = minimum + count
+            self.errors[item] = minimum
+        heapq.heappush(self.heap, (self.counts[item], item))
+        if len(self.heap) > 4 * self.capacity:
+            self.heap = [(count, item) for item, count in self.counts.items()]
+            heapq.heapify(self.heap)
+
+    def pop_min(self):
+        """Removes and returns the smallest current counter from the heap."""
+        while True:
+            count, item = heapq.heappop(self.heap)
+            if self.counts.get(item) == count:
+                return count, item
+
+    def min_count(self):
+        """Upper bound for the count of every item without a counter (0 while not all counters are in use)."""
+        if len(self.counts) < self.capacity:
+            return 0
+        return min(self.counts.values())
+
+    def estimate(self, item):
+        """Returns an upper bound for the count of the item."""
+        item = str(item)
+        rows, columns = self.hash_columns([item])
+        upper = int(self.table[rows, columns].min())
+        return min(upper, self.counts.get(item, self.min_count()))
+
+    def merge(self, other):
+        """Adds the counts of another sketch with the same capacity, width and depth."""
+        if (self.capacity, self.width, self.depth) != (other.capacity, other.width, other.depth):
+            raise ValueError("Only sketches with the same capacity, width and depth can be merged.")
+        # an item without a counter in one sketch gets that sketch's minimum as count and error
+        min_self, min_other = self.min_count(), other.min_count()
+        merged = {}
+        for item in set(self.counts) | set(other.counts):
+            count = self.counts.get(item, min_self) + other.counts.get(item, min_other)
+            error = self.errors.get(item, min_self) + other.errors.get(item, min_other)
+            merged[item] = (count, error)
+        kept = sorted(merged.items(), key=lambda entry: (-entry[1][0], entry[0]))[:self.capacity]
+        self.counts = {item: count for item, (count, error) in kept}
+        self.errors = {item: error for item, (count, error) in kept}
+        self.heap = [(count, item) for item, count in self.counts.items()]
+        heapq.heapify(self.heap)
+        self.table += other.table
+        self.total += other.total
+        return self
+
+    def top_k(self, k=None, label="item"):
+        """Returns the top k items with estimated count, lower bound, maximum error and whether the rank is guaranteed."""
+        ranked = sorted(self.counts.items(), key=lambda entry: (-entry[1], entry[0]))
+        k = len(ranked) if k is None else min(k, len(ranked))
+        rows, columns = self.hash_columns([item for item, _ in ranked[:k]])
+        upper_cms = self.table[rows, columns].reshape(-1, self.depth).min(axis=1) if k else []
+        # items below the top k (with or without a counter) have at most this count
+        threshold = max(ranked[k][1] if k < len(ranked) else 0, self.min_count())
+        result = []
+        for (item, count), cms in zip(ranked[:k], upper_cms):
+            lower = count - self.errors[item]
+            result.append({
+                label: item,
+                "count": min(count, int(cms)),
+                "count_lower": lower,
+                "max_error": min(count, int(cms)) - lower,
+                "guaranteed": lower >= threshold
+            })
+        return pd.DataFrame(result, columns=[label, "count", "count_lower", "max_error", "guaranteed"])
+
+    def save(self, path):
+        """Saves the sketch as .npz, so it can be merged with sketches of later runs."""
+        items = list(self.counts)
+        np.savez(
+            path,
+            items=np.array(items, dtype=str),
+            counts=np.array([self.counts[item] for item in items], dtype=np.int64),
+            errors=np.array([self.errors[item] for item in items], dtype=np.int64),
+            table=self.table,
+            meta=np.array([self.capacity, self.width, self.depth, self.total], dtype=np.int64)
+        )
+
+def load_sketch(path):
+    """Loads a sketch saved with FrequencySketch.save."""
+    with np.load(path) as data:
+        capacity, width, depth, total = data["meta"].tolist()
+        sketch = FrequencySketch(capacity, width, depth)
+        sketch.table = data["table"].copy()
+        sketch.total = total
+        items = data["items"].tolist()
+        sketch.counts = dict(zip(items, data["counts"].tolist()))
+        sketch.errors = dict(zip(items, data["errors"].tolist()))
+    sketch.heap = [(count, item) for item, count in sketch.counts.items()]
+    heapq.heapify(sketch.heap)
+    return sketch
+
+def merge_sketches(sketches):
+    """Merges sketches into a new sketch, None if the list is empty."""
+    merged = None
+    for sketch in sketches:
+        if merged is None:
+            merged = FrequencySketch(sketch.capacity, sketch.width, sketch.depth)
+        merged.merge(sketch)
+    return merged
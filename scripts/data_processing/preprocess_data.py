@@ -2,11 +2,13 @@ import sys
 import os
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
 import config_processing as config
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'common')))
+from emoji_tokenizer import replace_emojis
+from dataset_catalog import find_file, get_catalog, make_period
 
 import pandas as pd
 from datetime import datetime
 import re
-import emoji
 
 def get_party(username):
     """Get the party based on the username."""
@@ -26,8 +28,11 @@ def get_party(username):
 def preprocess_video(user, start_date, end_date):
     """Preprocess video data for a given user."""
     # define input and output paths
-    input_video = os.path.join("data", "data_raw", "videos", f"{user}_video_data_{start_date}_{end_date}_complete.csv")
+    input_video = find_file(user, make_period(start_date, end_date), "raw_videos")
     output_video = os.path.join("data", "data_preprocessed", "videos", f"{user}_video_data_{start_date}_{end_date}_preprocessed.csv")
+    if input_video is None:
+        print(f"No video data found for {user}. Skipping preprocessing.")
+        return False
     try:
         df_video = pd.read_csv(input_video, engine='python')
     except FileNotFoundError:
@@ -51,18 +56,20 @@ def preprocess_video(user, start_date, end_date):
 def clean_text(text):
     """Clean text by removing emojis and punctuation."""
     # remove emojis
-    text = emoji.replace_emoji(str(text), replace='')
+    text = replace_emojis(text, replace='')
     # remove punctuation marks
     text = re.sub(r'[^\w\s]', '', text)
     return text
 
 def preprocess_comments(user, start_date, end_date, comment_cols):
     """Preprocess comments for a given user and timeframe."""
-    input_dir = "data/data_raw/comments"
     output_dir = "data/data_preprocessed/comments"
     os.makedirs(output_dir, exist_ok=True)
-    input_path = os.path.join(input_dir, f"{user}_comments_{start_date}_{end_date}_complete.csv")
+    input_path = find_file(user, make_period(start_date, end_date), "raw_comments")
     output_path = os.path.join(output_dir, f"{user}_comments_{start_date}_{end_date}_preprocessed.csv")
+    if input_path is None:
+        print(f"No comments found for {user}. Skipping preprocessing.")
+        return
     try:
         df = pd.read_csv(input_path, engine='python')
         # filter columns
@@ -87,8 +94,8 @@ def aggregate_and_save_by_party(usernames, start_date, end_date):
         party = get_party(user)
 
         # load video data
-        video_path = os.path.join("data", "data_preprocessed", "videos", f"{user}_video_data_{start_date}_{end_date}_preprocessed.csv")
-        if os.path.exists(video_path):
+        video_path = find_file(user, make_period(start_date, end_date), "videos")
+        if video_path:
             df_video = pd.read_csv(video_path)
             df_video["username"] = user
             df_video["party"] = party
@@ -96,8 +103,8 @@ def aggregate_and_save_by_party(usernames, start_date, end_date):
             party_video_dfs.setdefault(party, []).append(df_video)
 
         # load comments
-        comment_path = os.path.join("data", "data_preprocessed", "comments", f"{user}_comments_{start_date}_{end_date}_preprocessed.csv")
-        if os.path.exists(comment_path):
+        comment_path = find_file(user, make_period(start_date, end_date), "comments")
+        if comment_path:
             df_comment = pd.read_csv(comment_path)
             df_comment["username"] = user
             df_comment["party"] = party
@@ -144,7 +151,8 @@ def main():
     for user in usernames:
         preprocess_comments(user, start_date, end_date, comment_cols)
 
-    # save df with videos and df with comments for each party
+    # save df with videos and df with comments for each party (the catalog is scanned again for the preprocessed files)
+    get_catalog(refresh=True)
     aggregate_and_save_by_party(usernames, start_date, end_date)
 
 if __name__ == "__main__":
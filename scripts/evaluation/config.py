@@ -184,4 +184,15 @@ linke_usernames = ["die.linke", "linkeessen", "dielinkelsa", "linke.sh", "dielin
   "gregorgysi48", "caren.lay.mdb", "susanneferschl", "die.linke..siwi"]
 
 start_date = "20250101"
-end_date = "20250223"
\ No newline at end of file
+end_date = "20250223"
+
+# re-thresholding of the text sentiment with the saved class probabilities, None keeps the labels of the model
+sentiment_neutral_band = None # e.g. 0.3: prob_positive - prob_negative within [-0.3, 0.3] is neutral
+sentiment_min_confidence = None # e.g. 0.6: predictions with a lower maximum probability are neutral
+
+# distributions of hashtags, effects, playlists and music (descriptive_analytics.py)
+distribution_mode = "exact" # exact (value_counts) or sketch (SpaceSaving/Count-Min with bounded memory, mergeable across periods)
+sketch_capacity = 5000 # SpaceSaving counters, the error of a reported count is at most total / capacity
+sketch_width = 16384 # Count-Min columns, error at most e / width * total with probability 1 - e^-depth
+sketch_depth = 4
+sketch_top_k = None # rows in the CSV files in sketch mode, None for all counters
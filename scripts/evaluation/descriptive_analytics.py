@@ -1,8 +1,12 @@
 import pandas as pd
 import os
+import sys
 import config
 import ast
 import matplotlib.pyplot as plt
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'common')))
+from dataset_catalog import find_file, list_accounts, make_period
+from frequency_sketch import FrequencySketch, merge_sketches
 
 plt.rcParams.update({
     "font.family": "serif",
@@ -21,17 +25,17 @@ def safe_literal_eval(val):
     except Exception:
         return []
 
-def load_party_data(userlist, video_dir, start_date, end_date):
+def load_party_data(userlist, period):
     """Loads and concatenates all video CSV files for a party."""
     dfs = []
     missing = []
     for user in userlist:
-        file_path = os.path.join(video_dir, f"{user}_video_data_{start_date}_{end_date}_preprocessed.csv")
-        if os.path.exists(file_path):
+        file_path = find_file(user, period, "videos")
+        if file_path is not None:
             df = pd.read_csv(file_path)
             dfs.append(df)
         else:
-            print(f"File not found: {file_path}")
+            print(f"File not found: {user} ({period})")
             missing.append(user)
     if dfs:
         return pd.concat(dfs, ignore_index=True), missing
@@ -58,20 +62,44 @@ def save_metrics(df, party, results_dir):
     topfive_path = os.path.join(results_dir, f"{party}_topfive.csv")
     top_videos.to_csv(topfive_path, index=False)
 
+def count_distribution_sketch(series):
+    """Counts the items of a column in a FrequencySketch row by row, without a flattened list of all items."""
+    sketch = FrequencySketch(config.sketch_capacity, config.sketch_width, config.sketch_depth)
+    for val in series.dropna():
+        sketch.update(item for item in safe_literal_eval(val) if item)
+    return sketch
+
+def save_distribution_sketch(sketch, name, label, results_dir):
+    """Saves the top k of a sketch with error bounds and the sketch itself for merges with other periods."""
+    sketch_dir = os.path.join(results_dir, "sketches")
+    os.makedirs(sketch_dir, exist_ok=True)
+    sketch.top_k(config.sketch_top_k, label).to_csv(os.path.join(results_dir, f"{name}_{label}.csv"), index=False)
+    sketch.save(os.path.join(sketch_dir, f"{name}_{label}.npz"))
+
 def save_distribution(df, party, results_dir):
-    """Saves the distributions of hashtags, effects, playlists, and music for a party."""
+    """Saves the distributions of hashtags, effects, playlists, and music for a party, returns the sketches in sketch mode."""
+    sketches = {}
     for col, label in [("hashtag_names", "hashtags"), ("effect_ids", "effects"), ("playlist_id", "playlists"), ("music_id", "music")]:
         if col in df.columns:
+            if config.distribution_mode == "sketch":
+                sketches[label] = count_distribution_sketch(df[col])
+                save_distribution_sketch(sketches[label], party, label, results_dir)
+                continue
             series = df[col].dropna().apply(safe_literal_eval)
             flat = [item for sublist in series for item in sublist if item]
             counts = pd.Series(flat).value_counts().reset_index()
             counts.columns = [label, 'count']
             counts.to_csv(os.path.join(results_dir, f"{party}_{label}.csv"), index=False)
+    return sketches
 
-def save_overall_distribution(all_df, results_dir):
-    """Saves the distributions and top 5 videos for all parties combined."""
+def save_overall_distribution(all_df, results_dir, party_sketches=None):
+    """Saves the distributions and top 5 videos for all parties combined, in sketch mode the party sketches are merged."""
     for col, label in [("hashtag_names", "hashtags"), ("effect_ids", "effects"), ("playlist_id", "playlists"), ("music_id", "music")]:
-        if col in all_df.columns:
+        if party_sketches:
+            merged = merge_sketches(sketches[label] for sketches in party_sketches if label in sketches)
+            if merged is not None:
+                save_distribution_sketch(merged, "all", label, results_dir)
+        elif col in all_df.columns:
             series = all_df[col].dropna().apply(safe_literal_eval)
             flat = [item for sublist in series for item in sublist if item]
             counts = pd.Series(flat).value_counts().reset_index()
@@ -342,10 +370,7 @@ def save_account_stats(all_df, results_dir):
 
 def main():
     # configurations
-    start_date = config.start_date
-    end_date = config.end_date
-    video_dir = os.path.join("data", "data_preprocessed", "videos")
-    comment_dir = os.path.join("data", "data_preprocessed", "comments")
+    period = make_period(config.start_date, config.end_date)
     results_dir = os.path.join("results", "descriptive_analysis")
     plot_dir = os.path.join("plots", "descriptive_analysis")
     os.makedirs(results_dir, exist_ok=True)
@@ -362,23 +387,24 @@ def main():
 
     no_videos = []
     all_dfs = []
+    party_sketches = []
 
     # Load and process video data for each party
     for party, userlist in parties.items():
-        party_df, missing = load_party_data(userlist, video_dir, start_date, end_date)
+        party_df, missing = load_party_data(userlist, period)
         no_videos.extend(missing)
         if party_df is not None:
             party_df["party"] = party
             all_dfs.append(party_df)
             save_metrics(party_df, party, results_dir)
-            save_distribution(party_df, party, results_dir)
+            party_sketches.append(save_distribution(party_df, party, results_dir))
         else:
             print(f"No data found for {party}")
 
     # Complete evaluation
     if all_dfs:
         all_df = pd.concat(all_dfs, ignore_index=True)
-        save_overall_distribution(all_df, results_dir)
+        save_overall_distribution(all_df, results_dir, party_sketches if config.distribution_mode == "sketch" else None)
 
         plot_videos_per_party(all_df, plot_dir)
         plot_metrics_rate(all_df, plot_dir)
@@ -389,8 +415,8 @@ def main():
         save_account_stats(all_df, results_dir)
 
     # Comment analysis
-    # get all comments
-    comment_files = [os.path.join(comment_dir, f) for f in os.listdir(comment_dir) if f.endswith(".csv")]
+    # get all comments of the period
+    comment_files = [find_file(user, period, "comments") for user in list_accounts(period, "comments")]
     comment_dfs = []
     for f in comment_files:
         try:
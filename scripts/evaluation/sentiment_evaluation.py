@@ -1,4 +1,5 @@
 import os
+import sys
 import glob
 import pandas as pd
 import config
@@ -7,6 +8,8 @@ import matplotlib.pyplot as plt
 import seaborn as sns
 import ast
 from matplotlib.colors import LinearSegmentedColormap
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'common')))
+from dataset_catalog import find_file, list_accounts, make_period
 
 plt.rcParams.update({
     "font.family": "serif",
@@ -38,12 +41,30 @@ def compute_final_sentiment(row):
     """Computes the final sentiment based on text and emoji sentiment."""
     if pd.isna(row['emoji_sentiment']):
         return row['sentiment_num']
+    # comments without words are not scored by the text model (sentiment "skipped")
+    if pd.isna(row['sentiment_num']):
+        return row['emoji_sentiment']
     if (pd.isna(row['text']) or str(row['text']).strip() == "") and row['extracted_emojis']:
         return row['emoji_sentiment']
     if row['sentiment_num'] is not None:
         return (row['sentiment_num'] + row['emoji_sentiment']) / 2
     return np.nan
 
+def rethreshold_sentiment(df, neutral_band=None, min_confidence=None):
+    """Relabels the text sentiment from the saved class probabilities without running the model again."""
+    # continuous score between -1 (negative) and 1 (positive)
+    score = df["prob_positive"] - df["prob_negative"]
+    labels = df["sentiment"].copy()
+    has_probs = score.notna()
+    if neutral_band is not None:
+        labels[has_probs] = np.where(score[has_probs] > neutral_band, "positive",
+                                     np.where(score[has_probs] < -neutral_band, "negative", "neutral"))
+    if min_confidence is not None:
+        # uncertain predictions are counted as neutral
+        confidence = df[["prob_positive", "prob_negative", "prob_neutral"]].max(axis=1)
+        labels[has_probs & (confidence < min_confidence)] = "neutral"
+    return labels
+
 def has_heart(emojis, heart):
     """Checks if the heart emoji is present in emojis, accounting for Unicode-escaped forms."""
     
@@ -361,7 +382,7 @@ def plot_text_sentiment_distribution(all_comments_df):
 
     # get text sentiment distribution by party
     sentiment_dist = (
-        all_comments_df
+        all_comments_df[all_comments_df["sentiment"].isin(["positive", "neutral", "negative"])]
         .groupby("party")["sentiment"]
         .value_counts(normalize=True)
         .unstack(fill_value=0)
@@ -667,11 +688,8 @@ def show_emoji_usage(all_comments_df):
 
 def main():
     # configurations
-    start_date = config.start_date
-    end_date = config.end_date
-    folder = f"results/sentiment_analysis/{start_date}_{end_date}_with_emoji_sentiment"
-    pattern = os.path.join(folder, "*.csv")
-    files = glob.glob(pattern)
+    period = make_period(config.start_date, config.end_date)
+    files = [find_file(user, period, "emoji_sentiment") for user in list_accounts(period, "emoji_sentiment")]
     topic_dir = os.path.join("results", "topic_analysis", "merged")
     output_sentiment_topic_dir = os.path.join("plots", "sentiment_analysis")
 
@@ -689,6 +707,11 @@ def main():
             print(f"Unknown party for {user}, skip: {file}")
             continue
         df = pd.read_csv(file)
+        # re-threshold the text sentiment with the class probabilities of the model if configured
+        if "prob_positive" in df.columns:
+            df["sentiment_score"] = df["prob_positive"] - df["prob_negative"]
+            if config.sentiment_neutral_band is not None or config.sentiment_min_confidence is not None:
+                df["sentiment"] = rethreshold_sentiment(df, config.sentiment_neutral_band, config.sentiment_min_confidence)
         # sentiment-mapping and final sentiment calculation
         df["sentiment_num"] = df["sentiment"].map({"positive": 1, "neutral": 0, "negative": -1})
         # map emoji sentiment with tolerance of 0.2